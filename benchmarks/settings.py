@@ -0,0 +1,34 @@
+"""Settings of the benchmarks, they never touch the database of the bots.
+
+BENCH_DB chooses the database: "sqlite" (default) or "postgres". Tables are
+created from the models, as the database is thrown away after the run.
+"""
+from tgBot.settings import *  # noqa: F401,F403
+
+# Queries are not kept in memory, like in production
+DEBUG = False
+
+if os.environ.get("BENCH_DB", "sqlite") == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql_psycopg2",
+            "NAME": os.environ.get("BENCH_PG_NAME", "questbot_bench"),
+            "USER": os.environ.get("BENCH_PG_USER", "questbot"),
+            "PASSWORD": os.environ.get("BENCH_PG_PASSWORD", ""),
+            "HOST": os.environ.get("BENCH_PG_HOST", "localhost"),
+            "PORT": os.environ.get("BENCH_PG_PORT", ""),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get(
+                "BENCH_SQLITE_NAME", os.path.join(BASE_DIR, "bench.sqlite3")
+            ),
+            # Writers of several threads wait for each other instead of failing
+            "OPTIONS": {"timeout": 30},
+        }
+    }
+
+MIGRATION_MODULES = {"questApp": None, "player": None, "payment": None}
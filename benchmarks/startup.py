@@ -0,0 +1,105 @@
+"""Measures how long the bots take to start and what they import.
+
+Usage: python benchmarks/startup.py [tg vk] [--runs 5] [--importtime 15]
+
+Every run is a fresh interpreter started in the project root, it sets Django
+up with 'tgBot.runtime' and imports the module of the platform. Reported are
+the medians and minimums of the runs, the queries made while importing and
+the SDKs that were loaded. '--importtime' also shows the slowest imports
+reported by 'python -X importtime'.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+CHILD = """
+import json, sys, time
+started_at = time.perf_counter()
+from tgBot import runtime
+runtime.setup()
+set_up_at = time.perf_counter()
+
+from django.db import connection
+queries = []
+with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+    runtime.load(sys.argv[1])
+loaded_at = time.perf_counter()
+
+print(json.dumps({
+    "setup": set_up_at - started_at,
+    "import": loaded_at - set_up_at,
+    "queries": len(queries),
+    "telegram": "telegram" in sys.modules,
+    "vk_api": "vk_api" in sys.modules,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run_child(platform, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", CHILD, platform]
+
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    result = json.loads(process.stdout.decode().strip().splitlines()[-1])
+    result["total"] = time.perf_counter() - started_at
+    return result, process.stderr.decode()
+
+
+def slowest_imports(stderr, limit):
+    """Returns '(cumulative microseconds, module)' of the slowest top-level imports"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("   "):
+            imports.append((int(cumulative), name.strip()))
+
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("platforms", nargs="*", default=["tg", "vk"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="LIMIT")
+    args = parser.parse_args()
+
+    for platform in args.platforms:
+        results = [run_child(platform)[0] for _ in range(args.runs)]
+
+        print("%s, %s runs:" % (platform, args.runs))
+        for key in ("total", "setup", "import"):
+            values = [result[key] for result in results]
+            print(
+                "  %-7s median %7.1f ms, min %7.1f ms"
+                % (key, statistics.median(values) * 1000, min(values) * 1000)
+            )
+        last = results[-1]
+        print(
+            "  queries while importing: %s, modules: %s, telegram: %s, vk_api: %s"
+            % (last["queries"], last["modules"], last["telegram"], last["vk_api"])
+        )
+
+        if args.importtime:
+            _, stderr = run_child(platform, importtime=True)
+            print("  slowest imports:")
+            for cumulative, name in slowest_imports(stderr, args.importtime):
+                print("  %9.1f ms  %s" % (cumulative / 1000, name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""Drives the bots with a swarm of simulated players.
+
+Usage: python -m benchmarks.swarm [--platform tg|vk|both] [--players 1000]
+           [--messages 20] [--workers 8] [--steps 10] [--options 3]
+           [--hidden 1] [--parts 1] [--junk 0.05] [--db sqlite|postgres]
+
+A synthetic quest is loaded into the benchmark database (see
+'benchmarks.settings'), then every player presses the buttons of the last
+keyboard the bot sent him, like a real player waits for the answer before
+the next press. Bots send to in-process fakes of the Telegram and VK APIs,
+which only record the messages. Handlers run on '--workers' threads, the
+messages of one player never run concurrently.
+
+Reported are messages handled per second, p50/p99 handler latency, DB
+queries per message and messages sent per second.
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+# The benchmark flushes its database, so it never runs with the bots' settings
+os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+
+# Id of the first simulated player, 'Player.user_id' is unique across the platforms
+FIRST_USER_IDS = {"tg": 10 ** 9, "vk": 2 * 10 ** 9}
+QUEST_NAME = "Benchmark"
+JUNK_TEXTS = ("привет", "что дальше?", "ok", "???", "/help")
+# Commands pressed when the keyboard has no Options, the first present wins
+PREFERRED_COMMANDS = (
+    "START_GAME",
+    "GAME",
+    "CONFIRM_TO_RESTART",
+    "ASK_TO_RESTART",
+    "ALL_GAMES",
+    "MAIN_MENU",
+)
+
+
+class Stats:
+    """Numbers collected by the worker threads"""
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = 0
+        self.sent = 0
+        self.errors = 0
+        self.first_error = None
+        self._lock = threading.Lock()
+
+    def add(self, latency, queries):
+        with self._lock:
+            self.latencies.append(latency)
+            self.queries += queries
+
+    def add_sent(self):
+        with self._lock:
+            self.sent += 1
+
+    def add_error(self):
+        with self._lock:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = traceback.format_exc()
+
+
+class Keyboards:
+    """Last keyboard sent to every player, as a serialized markup"""
+
+    def __init__(self):
+        self._markups = {}
+
+    def remember(self, user_id, markup):
+        if markup:
+            self._markups[int(user_id)] = markup
+
+    def get_texts(self, user_id):
+        markup = self._markups.get(user_id)
+        if not markup:
+            return []
+
+        markup = json.loads(markup)
+        if "keyboard" in markup:
+            return [button["text"] for row in markup["keyboard"] for button in row]
+
+        return [button["action"]["label"] for row in markup["buttons"] for button in row]
+
+
+def _done(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class FakeTelegramBot:
+    """Records messages instead of sending them, like 'MQBot' returns futures"""
+
+    def __init__(self, stats, keyboards):
+        self.stats = stats
+        self.keyboards = keyboards
+
+    def send_message(self, chat_id, text=None, reply_markup=None, **kwargs):
+        self.stats.add_sent()
+        self.keyboards.remember(chat_id, reply_markup)
+        return _done()
+
+    def send_photo(self, chat_id, photo=None, **kwargs):
+        self.stats.add_sent()
+        return _done()
+
+
+class FakeVkApi:
+    """Records messages of 'vk.messages.send', serves made-up profiles"""
+
+    def __init__(self, stats, keyboards):
+        self.messages = SimpleNamespace(send=self._send)
+        self.users = SimpleNamespace(get=self._get_users)
+        self.stats = stats
+        self.keyboards = keyboards
+
+    def _send(self, peer_id, keyboard=None, **kwargs):
+        self.stats.add_sent()
+        self.keyboards.remember(peer_id, keyboard)
+        return _done(1)
+
+    def _get_users(self, user_ids, **kwargs):
+        return [
+            {"id": int(user_id), "first_name": "Player", "last_name": str(user_id)}
+            for user_id in str(user_ids).split(",")
+        ]
+
+
+class FakeScheduler:
+    """Sends the delayed Step parts at once, the last one carries the keyboard"""
+
+    def __init__(self, send):
+        self.send = send
+
+    def schedule(self, chat_id, messages):
+        for _, text, reply_markup in messages:
+            self.send(chat_id, text, reply_markup)
+
+    def cancel(self, chat_id):
+        pass
+
+
+def build_quest(steps, options, hidden, parts):
+    """Loads a quest of 'steps' Steps with 'options' Options each.
+
+    Every Option leads to the next Step, the first Option of the last Step
+    wins and the others lead back to the first Step. Each Step also has
+    'hidden' Options, the first Option of the previous Step shows them.
+    """
+    from questApp.models import Option, Quest, Step
+
+    quest = Quest.objects.create(
+        name=QUEST_NAME,
+        is_active=True,
+        max_attempts=10 ** 6,
+        description="Synthetic quest of the benchmark",
+    )
+    step_objects = [
+        Step.objects.create(
+            quest=quest,
+            description="~0_".join(
+                "Step %s, part %s" % (index, part) for part in range(parts)
+            ),
+            is_first=not index,
+        )
+        for index in range(steps)
+    ]
+
+    shown_by = None
+    for index, step in enumerate(step_objects):
+        is_last = index == len(step_objects) - 1
+        next_step = step_objects[0] if is_last else step_objects[index + 1]
+
+        step_options = [
+            Option.objects.create(
+                text="Step %s option %s" % (index, number),
+                quest=quest,
+                next_step=None if is_last and not number else next_step,
+                is_winning=is_last and not number,
+                index=number,
+            )
+            for number in range(options)
+        ]
+        hidden_options = [
+            Option.objects.create(
+                text="Step %s secret %s" % (index, number),
+                quest=quest,
+                next_step=next_step,
+                is_hidden=True,
+                index=options + number,
+            )
+            for number in range(hidden)
+        ]
+
+        step.options.add(*step_options, *hidden_options)
+        if shown_by and hidden_options:
+            shown_by.changes.add(*hidden_options)
+        shown_by = step_options[0]
+
+    return quest
+
+
+def reset_database(args):
+    from django.core.management import call_command
+    from player.models import Player
+    from questApp.models import Quest
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    Quest.objects.all().delete()
+    Player.objects.all().delete()
+    build_quest(args.steps, args.options, args.hidden, args.parts)
+
+
+def choose_text(texts, junk, rng):
+    """Returns text a player sends seeing the keyboard with 'texts'"""
+    from django.conf import settings
+    from questApp import quest_utils
+
+    if not texts:
+        return quest_utils.menu_text_full("MAIN_MENU")
+
+    if rng.random() < junk:
+        return rng.choice(JUNK_TEXTS)
+
+    emojis = set(settings.BOT_MENU.values())
+    options = [text for text in texts if text.split(" ", 1)[0] not in emojis]
+    if options:
+        return rng.choice(options)
+
+    for name in PREFERRED_COMMANDS:
+        prefix = settings.BOT_MENU[name] + " "
+        for text in texts:
+            if text.startswith(prefix) and (
+                name == "GAME" or text == quest_utils.menu_text_full(name)
+            ):
+                return text
+
+    return rng.choice(texts)
+
+
+def create_handler(platform, stats, keyboards):
+    """Returns 'handle(user_id, text)' running the update like the bot does"""
+    if platform == "tg":
+        from tgAPI import utils
+        from tgAPI.bot import TGBot
+
+        bot = FakeTelegramBot(stats, keyboards)
+        scheduler = FakeScheduler(lambda *args: utils.send_message(bot, *args))
+
+        def handle(user_id, text):
+            user = SimpleNamespace(
+                id=user_id,
+                username="player%s" % user_id,
+                first_name="Player",
+                last_name=str(user_id),
+            )
+            update = SimpleNamespace(
+                message=SimpleNamespace(text=text, chat_id=user_id),
+                effective_chat=SimpleNamespace(id=user_id),
+                effective_user=user,
+            )
+            # The same as 'tgAPI.main.incoming_commands'
+            scheduler.cancel(user_id)
+            bot_ctx = TGBot(text, bot, update, scheduler)
+            command = TGBot.get_command(text, bot_ctx)
+            if command:
+                command()
+
+    else:
+        from vkAPI import main, utils
+
+        vk = FakeVkApi(stats, keyboards)
+        scheduler = FakeScheduler(lambda *args: utils.send_message(vk, *args))
+
+        def handle(user_id, text):
+            update = SimpleNamespace(
+                obj=SimpleNamespace(text=text, from_id=user_id, user_id=user_id),
+                type="message_new",
+            )
+            main.handle_message(vk, update, None, scheduler)
+
+    return handle
+
+
+def run_swarm(platform, args):
+    from django.db import close_old_connections, connection
+
+    stats = Stats()
+    keyboards = Keyboards()
+    handle = create_handler(platform, stats, keyboards)
+    rng = random.Random(args.seed)
+
+    players = queue.Queue()
+    remaining = {}
+    finished = []
+    finished_lock = threading.Lock()
+    first_user_id = FIRST_USER_IDS[platform]
+    for user_id in range(first_user_id, first_user_id + args.players):
+        remaining[user_id] = args.messages
+        players.put(user_id)
+
+    def count_query(execute, sql, params, many, context):
+        context["connection"].bench_queries += 1
+        return execute(sql, params, many, context)
+
+    def worker():
+        connection.bench_queries = 0
+        with connection.execute_wrapper(count_query):
+            while True:
+                user_id = players.get()
+                if user_id is None:
+                    break
+
+                text = choose_text(keyboards.get_texts(user_id), args.junk, rng)
+                queries_before = connection.bench_queries
+                started_at = time.perf_counter()
+                try:
+                    handle(user_id, text)
+                except Exception:
+                    stats.add_error()
+                finally:
+                    stats.add(
+                        time.perf_counter() - started_at,
+                        connection.bench_queries - queries_before,
+                    )
+
+                remaining[user_id] -= 1
+                if remaining[user_id]:
+                    players.put(user_id)
+                    continue
+
+                with finished_lock:
+                    finished.append(user_id)
+                    is_last = len(finished) == args.players
+                if is_last:
+                    for _ in range(args.workers):
+                        players.put(None)
+
+        close_old_connections()
+        connection.close()
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    return stats, elapsed
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(platform, args, stats, elapsed):
+    from django.db import connection
+
+    handled = len(stats.latencies)
+    print(
+        "%s on %s: %s players, %s messages, %s workers, %.1f s"
+        % (platform, connection.vendor, args.players, handled, args.workers, elapsed)
+    )
+    print("  messages/s       %10.1f" % (handled / elapsed))
+    print(
+        "  latency, ms      p50 %.2f  p99 %.2f  mean %.2f"
+        % (
+            percentile(stats.latencies, 0.5) * 1000,
+            percentile(stats.latencies, 0.99) * 1000,
+            statistics.mean(stats.latencies) * 1000,
+        )
+    )
+    print("  queries/message  %10.2f" % (stats.queries / handled))
+    print("  sent/s           %10.1f" % (stats.sent / elapsed))
+    print("  errors           %10d" % stats.errors)
+    if stats.first_error:
+        print(stats.first_error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--platform", choices=("tg", "vk", "both"), default="both")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20, help="Per player")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--options", type=int, default=3, help="Per Step")
+    parser.add_argument("--hidden", type=int, default=1, help="Per Step")
+    parser.add_argument("--parts", type=int, default=1, help="Per Step")
+    parser.add_argument("--junk", type=float, default=0.05, help="Share of junk")
+    parser.add_argument("--db", choices=("sqlite", "postgres"))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["BENCH_DB"] = args.db
+
+    from tgBot import runtime
+
+    runtime.setup()
+    reset_database(args)
+
+    platforms = ("tg", "vk") if args.platform == "both" else (args.platform,)
+    for platform in platforms:
+        stats, elapsed = run_swarm(platform, args)
+        report(platform, args, stats, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0002_auto_20200407_2111'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='short_url',
+            field=models.CharField(blank=True, max_length=256, null=True, verbose_name='Короткая ссылка на оплату'),
+        ),
+    ]
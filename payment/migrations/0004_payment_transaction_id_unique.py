@@ -0,0 +1,24 @@
+# Generated by Django 2.1.5 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+def empty_transaction_id_to_null(apps, schema_editor):
+    Payment = apps.get_model("payment", "Payment")
+    Payment.objects.filter(transaction_id="").update(transaction_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0003_payment_short_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(empty_transaction_id_to_null, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, max_length=256, null=True, unique=True, verbose_name='ID заказа'),
+        ),
+    ]
@@ -25,10 +25,15 @@ class Payment(models.Model):
 
     amount = models.DecimalField("Сумма к оплате", max_digits=15, decimal_places=3)
     profit = models.DecimalField("Зачисленино на ваш счет", max_digits=15, decimal_places=3, default=0)
-    transaction_id = models.CharField("ID заказа", max_length=256, null=True, blank=True)
+    transaction_id = models.CharField(
+        "ID заказа", max_length=256, null=True, blank=True, unique=True
+    )
     date_create = models.DateTimeField("Дата создания", auto_now_add=True)
     date_pay = models.DateTimeField("Дата оплаты", null=True, blank=True)
     is_awarding_time = models.BooleanField("Во время розыгрыша", default=False)
+    short_url = models.CharField(
+        "Короткая ссылка на оплату", max_length=256, null=True, blank=True
+    )
 
     def __str__(self):
         return self.player.name + " " + self.quest.name
@@ -0,0 +1,96 @@
+import logging
+import threading
+
+from django.conf import settings
+
+from player.models import Player
+from questApp.config_snapshot import config
+from questApp.models import Quest
+from tgBot import runtime
+
+logger = logging.getLogger(__name__)
+
+_tg = None
+_vk = None
+_lock = threading.Lock()
+
+
+def get_rate():
+    """Returns messages per second of this process, its share of 'NOTIFICATION_SENDER'"""
+    return settings.NOTIFICATION_SENDER["RATE"] / runtime.count_processes()
+
+
+def get_tg():
+    """Returns Telegram bot of this process, messages go through its own TgSender"""
+    global _tg
+
+    with _lock:
+        if _tg is None:
+            from tgAPI.main import create_bot
+            from tgAPI.sender import TgSender
+
+            _tg = create_bot(
+                sender=TgSender(
+                    rate=get_rate(),
+                    peer_rate=settings.TG_SENDER["PEER_RATE"],
+                    peer_burst=settings.TG_SENDER["PEER_BURST"],
+                    queue_size=settings.TG_SENDER["QUEUE_SIZE"],
+                    max_attempts=settings.TG_SENDER["MAX_ATTEMPTS"],
+                )
+            )
+
+    return _tg
+
+
+def get_vk():
+    """Returns VK API of this process, messages go through its own VkSender"""
+    global _vk
+
+    with _lock:
+        if _vk is None:
+            from vkAPI.sender import QueuedVkApi
+
+            _vk = QueuedVkApi(token=settings.VK_ACCESS_TOKEN, rate=get_rate()).get_api()
+
+    return _vk
+
+
+def send_text(player, text):
+    """Queues the message to the player, returns right away
+
+    :returns: Future of the sending, 'None' for unknown player types
+    """
+    if player.player_type == "TG":
+        return get_tg().send_message(chat_id=player.user_id, text=text)
+    elif player.player_type == "VK":
+        from vk_api.utils import get_random_id
+
+        return get_vk().messages.send(
+            peer_id=int(player.user_id), random_id=get_random_id(), message=text
+        )
+
+
+def notify_unlocked(player_id: int, quest_id: int):
+    """Tells the player that the paid quest is available"""
+    player = Player.objects.only("player_type", "user_id").filter(pk=player_id).first()
+    quest = Quest.objects.only("name").filter(pk=quest_id).first()
+    if not player or not quest:
+        return
+
+    def log_failure(future):
+        # The payment is done anyway, the player finds the quest in the menu
+        if future.exception() is not None:
+            logger.error(
+                "Player %s was not told about quest %s: %s",
+                player_id,
+                quest_id,
+                future.exception(),
+            )
+
+    try:
+        future = send_text(player, config.QUEST_UNLOCKED + ' "' + quest.name + '"')
+    except Exception:
+        logger.exception("Player %s was not told about quest %s", player_id, quest_id)
+    else:
+        if future is not None:
+            future.add_done_callback(log_failure)
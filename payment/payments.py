@@ -1,11 +1,19 @@
 import os
-import requests
-import json
 import hashlib
+import logging
+import threading
 import urllib.parse
 
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
 from payment.models import Payment
 from decimal import Decimal
+from tgBot.executor import KeyedExecutor
+from tgBot.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 MERCHANT_SECRET_KEY = os.getenv("MERCHANT_SECRET_KEY")
 MERCHANT_ID = os.getenv("MERCHANT_ID")
@@ -13,6 +21,17 @@ MERCHANT_URL = "https://anypay.io/merchant"
 VK_KEY = os.getenv("VK_ACCESS_TOKEN")
 CURRENCY = os.getenv("CURRENCY")
 
+# Connections to the shortener are kept and shared by the workers
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_maxsize=10))
+session.mount("http://", HTTPAdapter(pool_maxsize=10))
+
+_executor = None
+_executor_lock = threading.Lock()
+# Ids of the Payments whose link is queued for shortening
+_pending = set()
+_pending_lock = threading.Lock()
+
 
 def get_sign(price: Decimal, payment_id: int) -> str:
     return hashlib.md5(
@@ -20,30 +39,100 @@ def get_sign(price: Decimal, payment_id: int) -> str:
     ).hexdigest()
 
 
-def shorten_url(url: str):
-    vk_api_url = f"https://api.vk.com/method/utils.getShortLink?url={url}&access_token={VK_KEY}&v=5.100"
-    response = requests.get(vk_api_url)
+def get_executor():
+    """Returns worker pool shortening the links, it's started on the first use"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = KeyedExecutor(
+                "payment-links",
+                workers=settings.WORKER_POOLS["PAYMENT_LINKS"]["WORKERS"],
+                queue_size=settings.WORKER_POOLS["PAYMENT_LINKS"]["QUEUE_SIZE"],
+            )
+            _executor.start()
+
+    return _executor
 
-    if not response.ok:
+
+def shorten_url(url: str):
+    """Returns short link made by the shortener, 'None' if it failed"""
+    try:
+        response = session.get(
+            settings.PAYMENT_SHORTENER["URL"],
+            params={"url": url, "access_token": VK_KEY, "v": "5.100"},
+            timeout=settings.PAYMENT_SHORTENER["TIMEOUT"],
+        )
+        response.raise_for_status()
+        return response.json()["response"]["short_url"]
+    except (requests.RequestException, ValueError, KeyError) as exc:
+        logger.warning("Payment link %s was not shortened: %s", url, exc)
         return None
 
-    json_content = json.loads(response.content)
-    return json_content["response"]["short_url"]
+
+def save_short_url(payment_id: int, price: Decimal, url_long: str):
+    """Shortens the link of the Payment unless it's done or the price is changed"""
+    try:
+        payment = Payment.objects.filter(pk=payment_id, amount=price)
+        if not payment.filter(short_url__isnull=True).exists():
+            return
+
+        url_short = shorten_url(url_long)
+        if url_short:
+            metrics.increment("payment-links.shortened")
+            payment.update(short_url=url_short)
+        else:
+            metrics.increment("payment-links.failed")
+    finally:
+        with _pending_lock:
+            _pending.discard(payment_id)
+
+
+def schedule_short_url(payment_id: int, price: Decimal, url_long: str):
+    """Queues shortening of the link without waiting.
+
+    Nothing is queued if the Payment is queued already, and the job is dropped
+    if the lane is full: the player gets the long link and the next "buy"
+    press tries again.
+    """
+    with _pending_lock:
+        if payment_id in _pending:
+            return
+
+        _pending.add(payment_id)
+
+    if not get_executor().try_submit(
+        payment_id, save_short_url, payment_id, price, url_long
+    ):
+        metrics.increment("payment-links.dropped")
+        with _pending_lock:
+            _pending.discard(payment_id)
 
 
 def make_payment(user_id: int, quest_id: int, price: Decimal) -> str:
     """
     Makes payment-object and returns url to process payment
 
+    The short link is made in the background, until it's ready the long one
+    is returned. The caller never waits for the shortener.
+
     :param user_id: Id of user that want to buy
     :param quest_id: Id of quest that player wants to buy
     :param price: Price of the quest
     :return: URL to process payment, 'None' if something goes wrong
     """
 
-    payment, _ = Payment.objects.get_or_create(
+    payment, created = Payment.objects.get_or_create(
         player_id=user_id, quest_id=quest_id, defaults={"amount": price}
     )
+    if not created and payment.amount != price:
+        # The price is changed, the link made for the old one is wrong
+        payment.amount = price
+        payment.short_url = None
+        payment.save(update_fields=["amount", "short_url"])
+
+    if payment.short_url:
+        return payment.short_url
 
     sign = get_sign(price, payment.id)
     url_params = urllib.parse.quote(
@@ -51,5 +140,5 @@ def make_payment(user_id: int, quest_id: int, price: Decimal) -> str:
         safe="=",
     )
     url_long = f"{MERCHANT_URL}?{url_params}"
-    url_short = shorten_url(url_long)
-    return url_short
+    schedule_short_url(payment.id, price, url_long)
+    return url_long
@@ -1,3 +1,122 @@
-from django.test import TestCase
+import threading
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from payment import notifications, payments, views
+from payment.models import Payment
+from player.models import Player
+from questApp.models import Quest, QuestPermittedPlayers
+from tgBot.executor import KeyedExecutor
+
+
+class MakePaymentTests(TransactionTestCase):
+    def setUp(self):
+        self.quest = Quest.objects.create(name="Quest", price=Decimal("100"))
+        self.players = [Player.objects.create(user_id=user_id) for user_id in range(1, 4)]
+
+        # One lane with room for one waiting job
+        self.executor = KeyedExecutor("payment-links-test", workers=1, queue_size=1)
+        self.executor.start()
+        self.shortening = threading.Event()
+        self.resume = threading.Event()
+        self.calls = []
+
+        def slow_shorten_url(url):
+            self.calls.append(url)
+            self.shortening.set()
+            self.resume.wait(5)
+            return "https://vk.cc/short"
+
+        patchers = [
+            mock.patch.object(payments, "_executor", self.executor),
+            mock.patch.object(payments, "shorten_url", slow_shorten_url),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_payment(self, player):
+        return payments.make_payment(player.id, self.quest.id, self.quest.price)
+
+    def test_slow_shortener_never_blocks_handler(self):
+        first, second, third = self.players
+
+        url = self.make_payment(first)
+        self.assertTrue(self.shortening.wait(5))
+        # Pressed again while the link is being shortened, it's not queued twice
+        self.assertEqual(self.make_payment(first), url)
+        # Takes the only free place of the lane
+        self.make_payment(second)
+
+        # The lane is full, the job is dropped instead of blocking
+        with mock.patch.object(self.executor, "submit") as submit:
+            self.assertTrue(self.make_payment(third).startswith(payments.MERCHANT_URL))
+        submit.assert_not_called()
+
+        self.resume.set()
+        self.executor.join()
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.make_payment(first), "https://vk.cc/short")
+        # The dropped Payment is queued again by the next press
+        self.make_payment(third)
+        self.executor.join()
+        self.assertEqual(self.make_payment(third), "https://vk.cc/short")
+
+
+class ProcessPaymentTests(TestCase):
+    def setUp(self):
+        self.quest = Quest.objects.create(name="Quest", price=Decimal("100"))
+        self.player = Player.objects.create(user_id=1, player_type="TG")
+
+    def test_transaction_of_another_payment_is_skipped(self):
+        Payment.objects.create(amount=100, transaction_id="T1")
+        payment = Payment.objects.create(player=self.player, quest=self.quest, amount=100)
+
+        with self.assertLogs("payment.views", "ERROR"):
+            self.assertTrue(
+                views.process_payment(payment.id, "T1", "100", "95", "18.10.2026 10:00:00")
+            )
+
+        self.assertIsNone(Payment.objects.get(pk=payment.pk).transaction_id)
+        self.assertFalse(QuestPermittedPlayers.objects.exists())
+
+    def test_failed_notification_is_logged(self):
+        future = Future()
+
+        with mock.patch.object(notifications, "send_text", return_value=future):
+            notifications.notify_unlocked(self.player.id, self.quest.id)
+
+        with self.assertLogs("payment.notifications", "ERROR"):
+            future.set_exception(RuntimeError("Forbidden: bot was blocked by the user"))
+
+
+class NotificationSenderTests(SimpleTestCase):
+    def setUp(self):
+        notifications._tg = notifications._vk = None
+        self.addCleanup(setattr, notifications, "_tg", None)
+        self.addCleanup(setattr, notifications, "_vk", None)
+
+        patcher = mock.patch.object(
+            notifications.runtime, "count_processes", return_value=4
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_share_of_the_rate_is_split_between_processes(self):
+        with self.settings(NOTIFICATION_SENDER={"RATE": 2}):
+            self.assertEqual(notifications.get_rate(), 0.5)
+
+    def test_senders_take_the_share_only(self):
+        rate = notifications.get_rate()
+
+        tg_bucket = notifications.get_tg()._sender._bucket
+        vk_bucket = notifications.get_vk()._vk.sender._bucket
+
+        for bucket in (tg_bucket, vk_bucket):
+            self.assertEqual(bucket.rate, rate)
+            # Rates below one message per second still send right away
+            self.assertEqual(bucket.delay(), 0)
@@ -1,10 +1,17 @@
 import os
 import hashlib
+import logging
 from datetime import datetime
+from functools import partial
 
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from questApp.models import QuestPermittedPlayers
 from .models import Payment
+from .notifications import notify_unlocked
+
+logger = logging.getLogger(__name__)
 
 MERCHANT_IPS = ["185.162.128.38", "185.162.128.39", "185.162.128.88"]
 MERCHANT_SECRET_KEY = os.getenv("MERCHANT_SECRET_KEY")
@@ -15,6 +22,63 @@ def check_signature(sign, merchant_id, amount, pay_id):
     return sign_real == sign
 
 
+@transaction.atomic
+def process_payment(pay_id, transaction_id, amount, profit, date_pay) -> bool:
+    """
+    Marks the Payment as paid and gives the player access to the quest
+
+    Notifications repeated by the merchant are skipped, as well as the ones
+    with a transaction stored for another Payment. The player is told about
+    the quest once the transaction is committed.
+
+    :return: 'False' if there is no such Payment
+    """
+    payment = Payment.objects.select_for_update().filter(id=pay_id).first()
+    if payment is None:
+        return False
+
+    if payment.transaction_id:
+        if payment.transaction_id != transaction_id:
+            logger.warning(
+                "Payment %s is paid by %s and once more by %s",
+                pay_id,
+                payment.transaction_id,
+                transaction_id,
+            )
+        return True
+
+    payment.amount = amount
+    payment.profit = profit
+    payment.transaction_id = transaction_id
+    try:
+        payment.date_pay = datetime.strptime(date_pay, "%d.%m.%Y %H:%M:%S")
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        with transaction.atomic():
+            payment.save()
+    except IntegrityError:
+        # Repeating the notification can't fix it, so the merchant is answered 200
+        logger.error(
+            "Transaction %s of Payment %s is stored for another Payment",
+            transaction_id,
+            pay_id,
+        )
+        return True
+
+    if payment.player_id and payment.quest_id:
+        _, created = QuestPermittedPlayers.objects.get_or_create(
+            quest_id=payment.quest_id, player_id=payment.player_id
+        )
+        if created:
+            transaction.on_commit(
+                partial(notify_unlocked, payment.player_id, payment.quest_id)
+            )
+
+    return True
+
+
 @csrf_exempt
 def anypay_webhook(request):
     ip = request.META.get('HTTP_X_REAL_IP', request.META.get("REMOTE_ADDR"))
@@ -26,21 +90,12 @@ def anypay_webhook(request):
 
     sign = request.POST.get("sign")
     sign_status = check_signature(sign, merchant_id, amount, pay_id)
-    if sign_status and ip_status:
+    transaction_id = request.POST.get("transaction_id")
+    if sign_status and ip_status and transaction_id:
         profit = request.POST.get("profit")
-        transaction_id = request.POST.get("transaction_id")
         date_pay = request.POST.get("pay_date")
 
-        payment = Payment.objects.filter(id=pay_id).first()
-        payment.amount = amount
-        payment.profit = profit
-        payment.transaction_id = transaction_id
-        try:
-            payment.date_pay = datetime.strptime(date_pay, "%d.%m.%Y %H:%M:%S")
-        except ValueError:
-            pass
-        payment.save()
-
-        return HttpResponse(status=200)
-    else:
-        return HttpResponse(status=400)
+        if process_payment(pay_id, transaction_id, amount, profit, date_pay):
+            return HttpResponse(status=200)
+
+    return HttpResponse(status=400)
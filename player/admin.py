@@ -9,6 +9,8 @@ class PlayersAdmin(admin.ModelAdmin):
     )
     list_filter = ("player_type",)
     search_fields = ("name",)
+    # A select of every PlayersQuest is too big to render
+    raw_id_fields = ("active_quest",)
 
 
 admin.site.register(Player, PlayersAdmin)
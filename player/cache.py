@@ -0,0 +1,31 @@
+"""Identity cache of the players: (player_type, user_id) -> Player pk.
+
+Only the identity is kept. Game state of the player (active quest, next
+message flags, staff rights) is changed by other processes as well, so the
+row is read fresh on every update.
+"""
+from django.conf import settings
+
+from tgBot.cache import TTLCache
+
+_players = TTLCache(
+    timeout=settings.CACHING_TIMEOUTS["PLAYER"]["TIMEOUT"],
+    maxsize=settings.CACHING_TIMEOUTS["PLAYER"]["MAXSIZE"],
+)
+
+
+def _key(player_type, user_id):
+    return player_type, str(user_id)
+
+
+def get_pk(player_type, user_id):
+    """Returns pk of the player, 'None' on cache miss"""
+    return _players.get(_key(player_type, user_id))
+
+
+def remember(player):
+    _players.set(_key(player.player_type, player.user_id), player.pk)
+
+
+def forget(player):
+    _players.pop(_key(player.player_type, player.user_id))
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.5 on 2026-10-18 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0016_remove_playersquest_changes'),
+        ('player', '0012_auto_20200621_1630'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='active_quest',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='questApp.PlayersQuest', verbose_name='Играет прямо сейчас'),
+        ),
+    ]
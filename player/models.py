@@ -30,6 +30,14 @@ class Player(models.Model):
     )
     player_type = models.CharField("Тип пользователя", max_length=256)
     is_staff = models.BooleanField("Повышенные права", default=False)
+    active_quest = models.ForeignKey(
+        "questApp.PlayersQuest",
+        related_name="+",
+        verbose_name="Играет прямо сейчас",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
 
     @property
     def referral_link(self):
@@ -69,39 +77,36 @@ class Player(models.Model):
             return first_quest
 
     def get_active_quest(self, select_related=None, prefetch_related=None, only=None):
-        try:
-            qs = self.player_quests
-
-            if select_related:
-                qs.select_related(*select_related)
+        if not self.active_quest_id:
+            return None
 
-            if prefetch_related:
-                qs.prefetch_related(*prefetch_related)
+        if Player.active_quest.is_cached(self) and not (prefetch_related or only):
+            # Loaded along with the player, e.g. by 'quest_utils.load_player'
+            return self.active_quest
 
-            if only:
-                qs.only(*only)
+        qs = self.player_quests.all()
 
-            player_quest = qs.get(is_active=True)
-            return player_quest
-        except self.player_quests.model.DoesNotExist:
-            return None
-        except self.player_quests.model.MultipleObjectsReturned:
-            qs = self.player_quests.filter(is_active=True)
+        if select_related:
+            qs = qs.select_related(*select_related)
 
-            if select_related:
-                qs.select_related(*select_related)
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
 
-            if prefetch_related:
-                qs.prefetch_related(*prefetch_related)
+        if only:
+            qs = qs.only(*only)
 
-            if only:
-                qs.only(*only)
+        try:
+            return qs.get(pk=self.active_quest_id)
+        except self.player_quests.model.DoesNotExist:
+            return None
 
-            player_quest = qs.first()
+    def set_active_quest(self, player_quest, save=True):
+        """Makes the 'player_quest' the only active one, it's a single UPDATE of the Player"""
+        if self.active_quest_id != player_quest.pk:
+            self.active_quest = player_quest
 
-            player_quest.is_active = True
-            player_quest.save()
-            return player_quest
+            if save:
+                self.save(update_fields=["active_quest"])
 
     def get_my_quests(self, select_related=None, prefetch_related=None):
         qs = self.player_quests.all()
@@ -150,10 +155,10 @@ class Player(models.Model):
         if not current_step:
             current_step = quest.first_step
         player_quest = self.player_quests.create(
-            player=self, quest=quest, current_step=current_step, is_active=is_active
+            player=self, quest=quest, current_step=current_step
         )
-        if save:
-            player_quest.save()
+        if is_active:
+            self.set_active_quest(player_quest, save=save)
 
         return player_quest
 
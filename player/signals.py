@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from player import cache
+from player.models import Player
+
+
+@receiver(post_save, sender=Player)
+def remember_player(sender, instance, **kwargs):
+    cache.remember(instance)
+
+
+@receiver(post_delete, sender=Player)
+def forget_player(sender, instance, **kwargs):
+    cache.forget(instance)
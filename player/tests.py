@@ -1,3 +1,63 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from player import cache
+from player.models import Player
+from questApp import quest_utils
+from questApp.models import PlayersQuest, Quest
+
+
+def resolve(user_id="1", first_name="First", second_name="Second"):
+    return quest_utils.get_or_create_player(
+        user_login="login",
+        user_id=user_id,
+        referred_by=None,
+        player_type="TG",
+        first_name=first_name,
+        second_name=second_name,
+    )
+
+
+class GetOrCreatePlayerTests(TestCase):
+    def setUp(self):
+        self.player, created = resolve()
+        self.assertTrue(created)
+        cache.remember(self.player)
+
+    def test_known_player_is_read_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            player, created = resolve()
+
+        self.assertFalse(created)
+        self.assertEqual(player.pk, self.player.pk)
+        self.assertEqual(len(queries), 1)
+
+    def test_changed_profile_is_written(self):
+        player, _ = resolve(first_name="Renamed")
+
+        self.assertEqual(Player.objects.get(pk=player.pk).first_name, "Renamed")
+
+    def test_game_state_changed_by_another_process_is_seen(self):
+        quest = Quest.objects.create(name="Quest")
+        player_quest = PlayersQuest.objects.create(quest=quest, player=self.player)
+        # Written without signals, like another process does it
+        Player.objects.filter(pk=self.player.pk).update(
+            active_quest=player_quest, is_next_message_contact=True
+        )
+
+        player, _ = resolve()
+
+        self.assertTrue(player.is_next_message_contact)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                player.get_active_quest(select_related=("quest",)).quest.name, "Quest"
+            )
+
+    def test_deleted_player_is_created_again(self):
+        Player.objects.filter(pk=self.player.pk).delete()
+
+        player, created = resolve()
+
+        self.assertTrue(created)
+        self.assertNotEqual(player.pk, self.player.pk)
@@ -13,7 +13,6 @@ class PlayersQuestAdmin(admin.ModelAdmin):
     list_filter = ("quest__name", "player__player_type")
     search_fields = ("player__name",)
     autocomplete_fields = ["current_step"]
-    filter_horizontal = ("changes",)
 
 
 class PlayersQuestCompletedAdmin(admin.ModelAdmin):
@@ -35,7 +34,7 @@ class StepAdmin(admin.ModelAdmin):
     list_filter = ("quest", "is_first")
     filter_horizontal = ("options",)
     search_fields = ("quest__name", "description")
-    exclude = ("vk_image",)
+    exclude = ("vk_image", "tg_image")
 
     def step_name(self, obj):
         return obj.description[:30] + ".."
@@ -63,7 +62,7 @@ class OptionAdmin(admin.ModelAdmin):
 
 class QuestAdmin(admin.ModelAdmin):
     search_fields = ("name",)
-    exclude = ("vk_image_descr", "vk_image_award")
+    exclude = ("vk_image_descr", "vk_image_award", "tg_image_descr", "tg_image_award")
 
 
 class QuestPermittedPlayersAdmin(admin.ModelAdmin):
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class QuestappConfig(AppConfig):
     name = 'questApp'
+
+    def ready(self):
+        from questApp import signals  # noqa: F401
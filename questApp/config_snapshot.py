@@ -0,0 +1,100 @@
+import threading
+import time
+
+from constance import config as constance_config
+from django.conf import settings
+from django.db.models import F
+
+from questApp.models import ConfigVersion
+
+# The only row of 'ConfigVersion'
+VERSION_PK = 1
+
+
+def get_shared_version():
+    """Returns number of the config changes made by any process, one single-row query"""
+    return (
+        ConfigVersion.objects.filter(pk=VERSION_PK)
+        .values_list("version", flat=True)
+        .first()
+        or 0
+    )
+
+
+def bump_shared_version():
+    updated = ConfigVersion.objects.filter(pk=VERSION_PK).update(
+        version=F("version") + 1
+    )
+    if not updated:
+        ConfigVersion.objects.get_or_create(pk=VERSION_PK, defaults={"version": 1})
+
+
+class ConfigSnapshot:
+    """Process-local copy of every 'CONSTANCE_CONFIG' value.
+
+    Values are served from memory. Every 'timeout' seconds the snapshot
+    compares its version with the shared 'ConfigVersion' row, one single-row
+    query, and reads the values again through constance only when another
+    process has changed the config meanwhile. 'version' is the shared one,
+    so things rendered from the config can be cached against it.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.version = 0
+        self._values = None
+        self._checked_at = 0
+        # Reading a value that isn't stored yet makes constance store its
+        # default and send 'config_updated', which invalidates the snapshot
+        # from inside of the load
+        self._lock = threading.RLock()
+
+    def _is_expired(self):
+        return (
+            self.timeout is not None
+            and time.monotonic() - self._checked_at > self.timeout
+        )
+
+    def get_values(self):
+        values = self._values
+
+        if values is None or self._is_expired():
+            with self._lock:
+                if self._values is None or self._is_expired():
+                    # Read before the values, a change made in between is
+                    # picked up by the next check
+                    version = get_shared_version()
+
+                    if self._values is None or version != self.version:
+                        self._values = {
+                            name: getattr(constance_config, name)
+                            for name in settings.CONSTANCE_CONFIG
+                        }
+                        self.version = version
+
+                    self._checked_at = time.monotonic()
+
+                values = self._values
+
+        return values
+
+    def get_version(self):
+        """Returns version of the values that are served right now"""
+        self.get_values()
+        return self.version
+
+    def invalidate(self):
+        """Makes every process read the values again, called when the config is changed"""
+        bump_shared_version()
+
+        with self._lock:
+            self._values = None
+
+    def __getattr__(self, name):
+        try:
+            return self.get_values()[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+config = ConfigSnapshot(timeout=settings.CACHING_TIMEOUTS["CONFIG"]["TIMEOUT"])
@@ -0,0 +1,47 @@
+from questApp import quest_catalog
+
+
+class Entitlements:
+    """Quests the player may play and has paid for.
+
+    Ids of the player's QuestPermittedPlayers quests are read with one query
+    on the first check that needs them and reused after it, so an instance
+    lives as long as a single update is handled.
+    """
+
+    def __init__(self, player):
+        self.player = player
+        self._permitted_quest_ids = None
+
+    @property
+    def permitted_quest_ids(self) -> frozenset:
+        if self._permitted_quest_ids is None:
+            self._permitted_quest_ids = frozenset(
+                self.player.permissions.values_list("quest_id", flat=True)
+            )
+
+        return self._permitted_quest_ids
+
+    def can_play(self, quest) -> bool:
+        if self.player.is_staff:
+            return True
+
+        if not quest.is_active:
+            return False
+
+        return quest.is_on_sale or quest.id in self.permitted_quest_ids
+
+    def is_paid(self, quest) -> bool:
+        if quest.price == 0 or self.player.is_staff:
+            return True
+
+        return quest.id in self.permitted_quest_ids
+
+    def can_play_paid(self, quest) -> bool:
+        return self.can_play(quest) and self.is_paid(quest)
+
+    def get_available_quests(self):
+        """Returns quests of the catalog the player may play"""
+        return [
+            quest for quest in quest_catalog.get_catalog().quests if self.can_play(quest)
+        ]
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from questApp import quest_graph
+from questApp.models import Quest, Step
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends images of the quests to a Telegram chat and saves their file_id, "
+        "so players get them without Telegram downloading them from the site"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "quest_ids",
+            nargs="*",
+            type=int,
+            help="Quests to prewarm, all active ones by default",
+        )
+        parser.add_argument(
+            "--chat",
+            default=settings.TG_PREWARM_CHAT_ID,
+            help="Chat the images are sent to, the bot must be able to write there",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Don't delete the sent messages"
+        )
+
+    def handle(self, *args, **options):
+        if not options["chat"]:
+            raise CommandError("Set --chat or TG_PREWARM_CHAT_ID")
+
+        # The bot module sets up Telegram, it's not needed by other commands
+        from tgAPI import utils
+        from tgAPI.main import create_bot
+
+        bot = create_bot()
+        chat_id = options["chat"]
+
+        quests = Quest.objects.all()
+        if options["quest_ids"]:
+            quests = quests.filter(pk__in=options["quest_ids"])
+        else:
+            quests = quests.filter(is_active=True)
+
+        images = []
+        for quest in quests:
+            for attr in ("image_descr", "image_award"):
+                if getattr(quest, attr) and not getattr(quest, "tg_" + attr):
+                    images.append((Quest, quest.pk, attr, getattr(quest, attr)))
+
+            step_ids = quest_graph.compile_quest(quest.pk).steps
+            steps = Step.objects.filter(
+                pk__in=list(step_ids), image__isnull=False, tg_image__isnull=True
+            ).exclude(image="")
+            for step in steps:
+                images.append((Step, step.pk, "image", step.image))
+
+        for model, pk, attr, image in images:
+            try:
+                message = bot.send_photo(chat_id, photo=image).result()
+            except Exception as exc:
+                self.stderr.write("{} {} {}: {}".format(model.__name__, pk, image, exc))
+                continue
+
+            utils.save_file_id(model, pk, attr, image, message)
+            if not options["keep"]:
+                bot.delete_message(chat_id, message.message_id)
+
+        self.stdout.write("Images sent: {}".format(len(images)))
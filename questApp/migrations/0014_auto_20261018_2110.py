@@ -0,0 +1,23 @@
+# Generated by Django 2.1.5 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0013_auto_20200621_1630'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='option',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Бит в квесте'),
+        ),
+        migrations.AddField(
+            model_name='playersquest',
+            name='changed_options',
+            field=models.BinaryField(blank=True, default=b'', verbose_name='Изменённые опции'),
+        ),
+    ]
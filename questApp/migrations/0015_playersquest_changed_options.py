@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+def to_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, "little")
+
+
+def changes_to_bits(apps, schema_editor):
+    Option = apps.get_model("questApp", "Option")
+    PlayersQuest = apps.get_model("questApp", "PlayersQuest")
+
+    # Bits are unique over all quests, the same as 'Option.save' assigns them
+    for bit, option in enumerate(Option.objects.order_by("pk")):
+        option.bit = bit
+        option.save(update_fields=["bit"])
+
+    bits = dict(Option.objects.values_list("pk", "bit"))
+    masks = {}
+    changes = PlayersQuest.changes.through.objects.values_list(
+        "playersquest_id", "option_id"
+    )
+    for player_quest_id, option_id in changes:
+        masks[player_quest_id] = masks.get(player_quest_id, 0) | 1 << bits[option_id]
+
+    for player_quest_id, mask in masks.items():
+        PlayersQuest.objects.filter(pk=player_quest_id).update(
+            changed_options=to_bytes(mask)
+        )
+
+
+def bits_to_changes(apps, schema_editor):
+    Option = apps.get_model("questApp", "Option")
+    PlayersQuest = apps.get_model("questApp", "PlayersQuest")
+    Through = PlayersQuest.changes.through
+
+    options = {bit: pk for pk, bit in Option.objects.values_list("pk", "bit")}
+
+    rows = []
+    for player_quest in PlayersQuest.objects.exclude(changed_options=b""):
+        mask = int.from_bytes(bytes(player_quest.changed_options), "little")
+        for bit in range(mask.bit_length()):
+            option_id = options.get(bit)
+            if mask >> bit & 1 and option_id:
+                rows.append(
+                    Through(playersquest_id=player_quest.pk, option_id=option_id)
+                )
+
+    Through.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0014_auto_20261018_2110'),
+    ]
+
+    operations = [
+        migrations.RunPython(changes_to_bits, bits_to_changes),
+    ]
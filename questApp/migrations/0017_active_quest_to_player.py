@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def is_active_to_player(apps, schema_editor):
+    Player = apps.get_model("player", "Player")
+    PlayersQuest = apps.get_model("questApp", "PlayersQuest")
+
+    # Several active quests are possible in old data, the last changed one wins
+    active_quests = PlayersQuest.objects.filter(is_active=True).order_by(
+        "date_changed", "pk"
+    )
+    players = {}
+    for player_id, player_quest_id in active_quests.values_list("player_id", "pk"):
+        players[player_id] = player_quest_id
+
+    for player_id, player_quest_id in players.items():
+        Player.objects.filter(pk=player_id).update(active_quest_id=player_quest_id)
+
+
+def player_to_is_active(apps, schema_editor):
+    Player = apps.get_model("player", "Player")
+    PlayersQuest = apps.get_model("questApp", "PlayersQuest")
+
+    active_quest_ids = Player.objects.filter(
+        active_quest__isnull=False
+    ).values_list("active_quest_id", flat=True)
+    PlayersQuest.objects.filter(pk__in=list(active_quest_ids)).update(is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0016_remove_playersquest_changes'),
+        ('player', '0013_player_active_quest'),
+    ]
+
+    operations = [
+        migrations.RunPython(is_active_to_player, player_to_is_active),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.5 on 2026-10-18 21:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0017_active_quest_to_player'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='playersquest',
+            name='is_active',
+        ),
+    ]
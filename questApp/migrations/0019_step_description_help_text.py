@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0018_remove_playersquest_is_active'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='step',
+            name='description',
+            field=models.TextField(help_text='Символы _ и ~ внутри текста пишутся как \\_ и \\~', max_length=4096, verbose_name='Текст:\nтекст~время_текст~время\n'),
+        ),
+    ]
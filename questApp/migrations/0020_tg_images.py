@@ -0,0 +1,28 @@
+# Generated by Django 2.1.5 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0019_step_description_help_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quest',
+            name='tg_image_award',
+            field=models.CharField(blank=True, max_length=256, null=True, verbose_name='tg_image_award'),
+        ),
+        migrations.AddField(
+            model_name='quest',
+            name='tg_image_descr',
+            field=models.CharField(blank=True, max_length=256, null=True, verbose_name='tg_image_descr'),
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='tg_image',
+            field=models.CharField(blank=True, max_length=256, null=True, verbose_name='tg_image'),
+        ),
+    ]
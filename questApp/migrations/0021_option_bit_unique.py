@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questApp', '0020_tg_images'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='option',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Бит'),
+        ),
+    ]
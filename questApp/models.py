@@ -4,6 +4,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from player.models import Player
+from questApp.step_parts import parse_description
 
 
 class Quest(models.Model):
@@ -45,6 +46,12 @@ class Quest(models.Model):
     vk_image_award = models.CharField(
         "vk_image_award", max_length=256, null=True, blank=True
     )
+    tg_image_descr = models.CharField(
+        "tg_image_descr", max_length=256, null=True, blank=True
+    )
+    tg_image_award = models.CharField(
+        "tg_image_award", max_length=256, null=True, blank=True
+    )
 
     @property
     def is_awarding(self):
@@ -61,21 +68,9 @@ class Quest(models.Model):
     def first_step(self):
         return self.step_set.filter(is_first=True).first()
 
-    def check_permission(self, player) -> bool:
-        if player.is_staff:
-            return True
-
-        if not self.is_active:
-            return False
-
-        if player.permissions.filter(quest_id=self.id).exists():
-            return True
-
-        if self.date_sale_end:
-            if timezone.now() > self.date_sale_end:
-                return False
-
-        return True
+    @property
+    def is_on_sale(self):
+        return not self.date_sale_end or timezone.now() <= self.date_sale_end
 
     def __str__(self):
         return self.name
@@ -115,6 +110,18 @@ class Option(models.Model):
     is_hidden = models.BooleanField("Скрытый", default=False)
     is_winning = models.BooleanField("Победный вариант", default=False)
     index = models.PositiveSmallIntegerField("Индекс отображения", default=1)
+    bit = models.PositiveSmallIntegerField(
+        "Бит", null=True, blank=True, editable=False, unique=True
+    )
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            # Position of the option in 'PlayersQuest.changed_options'. It's unique
+            # over all quests, as Options may lead to Steps of other quests
+            last_bit = Option.objects.aggregate(last_bit=models.Max("bit"))["last_bit"]
+            self.bit = 0 if last_bit is None else last_bit + 1
+
+        super(Option, self).save(*args, **kwargs)
 
     def __str__(self):
         return str(self.pk) + " - " + self.text[:8]
@@ -126,9 +133,14 @@ class Option(models.Model):
 
 
 class Step(models.Model):
-    description = models.TextField("Текст:\nтекст~время_текст~время\n", max_length=4096)
+    description = models.TextField(
+        "Текст:\nтекст~время_текст~время\n",
+        max_length=4096,
+        help_text="Символы _ и ~ внутри текста пишутся как \\_ и \\~",
+    )
     image = models.URLField("Ссылка на картинку:", null=True, blank=True)
     vk_image = models.CharField("vk_image", max_length=256, null=True, blank=True)
+    tg_image = models.CharField("tg_image", max_length=256, null=True, blank=True)
     is_first = models.BooleanField("Первый шаг", default=False)
     delay = models.FloatField("Стандартная задержка (сек)", default=1)
     quest = models.ForeignKey(
@@ -140,6 +152,11 @@ class Step(models.Model):
     )
 
     def clean(self, *args, **kwargs):
+        try:
+            parse_description(self.description, self.delay)
+        except ValueError as exc:
+            raise ValidationError({"description": str(exc)})
+
         if self.is_first:
             is_unique = Step.objects.filter(quest=self.quest, is_first=True).first()
             if not is_unique:
@@ -175,21 +192,35 @@ class PlayersQuest(models.Model):
         blank=True,
     )
     attempts_num = models.PositiveIntegerField("Количество попыток", default=0)
-    changes = models.ManyToManyField(Option, verbose_name="Изменяет опции", blank=True)
+    changed_options = models.BinaryField("Изменённые опции", default=b"", blank=True)
     date_started = models.DateTimeField(auto_now_add=True)
     date_changed = models.DateTimeField(auto_now=True)
-    is_active = models.BooleanField("Играет прямо сейчас", default=False)
     is_complete = models.BooleanField("Завершил", default=False)
 
+    # Fields written when the player answers an Option
+    STEP_FIELDS = [
+        "current_step",
+        "changed_options",
+        "attempts_num",
+        "is_complete",
+        "date_changed",
+    ]
+
     @property
-    def is_paid(self) -> bool:
-        if self.quest.price == 0:
-            return True
+    def toggles(self) -> int:
+        """Bitset of Options changed by the player, indexed by 'Option.bit'"""
+        return int.from_bytes(bytes(self.changed_options or b""), "little")
 
-        if self.player.is_staff:
-            return True
+    @toggles.setter
+    def toggles(self, value):
+        self.changed_options = value.to_bytes((value.bit_length() + 7) // 8, "little")
+
+    def is_option_visible(self, option) -> bool:
+        # Hidden options are shown once changed and the visible ones are hidden
+        return option.is_hidden == bool(self.toggles >> option.bit & 1)
 
-        return self.permitted_quests.exists()
+    def apply_changes(self, option):
+        self.toggles |= option.changes_mask
 
     @property
     def is_expired(self):
@@ -213,29 +244,34 @@ class PlayersQuest(models.Model):
 
         return self.attempts_num >= self.quest.max_attempts
 
+    @property
+    def is_active(self) -> bool:
+        return self.player.active_quest_id == self.pk
+
     def set_active(self, save=True):
-        if self.is_paid:
-            self.is_active = True
-            if save:
-                self.save()
+        """Makes it the active quest of the player, the caller checks it's paid with 'Entitlements'"""
+        self.player.set_active_quest(self, save=save)
 
     def get_current_step(self):
-        return self.current_step
+        """Returns compiled current Step from the in-memory quest graph"""
+        from questApp import quest_graph
+
+        return quest_graph.get_step(self.quest_id, self.current_step_id)
 
     def set_current_step(self, next_step, save=True):
-        current = self.get_current_step()
-        if next_step != current:
-            self.current_step = next_step
+        next_step_id = next_step.id if next_step else None
+        if next_step_id != self.current_step_id:
+            self.current_step_id = next_step_id
 
             if save:
                 self.save()
 
     def clear_game(self, is_paid=True, save=True, clear_date=False):
-        quest = self.quest
-        current_step = Step.objects.filter(quest=quest, is_first=True).first()
-        self.current_step = current_step
+        from questApp import quest_graph
+
+        self.current_step_id = quest_graph.get_quest(self.quest_id).first_step_id
         self.is_complete = False
-        self.changes.clear()
+        self.toggles = 0
 
         if clear_date:
             self.date_started = timezone.now()
@@ -261,7 +297,7 @@ class PlayersQuest(models.Model):
             player=self.player,
             quest=self.quest,
             is_in_awarding_time=self.quest.is_awarding,
-            option=option,
+            option_id=option.id,
         )
         record.save()
         self.increment_attempts(save=False)
@@ -270,17 +306,6 @@ class PlayersQuest(models.Model):
         if save:
             self.save()
 
-    def save(self, *args, **kwargs):
-        if self.is_active:
-            active_quest = PlayersQuest.objects.filter(
-                player=self.player, is_active=True
-            ).exclude(pk=self.pk)
-
-            if active_quest:
-                active_quest.update(is_active=False)
-
-        super(PlayersQuest, self).save(*args, **kwargs)
-
     def __str__(self):
         return f"{self.quest.name[:8]} - {self.player.name}"
 
@@ -322,3 +347,13 @@ class PlayersQuestCompleted(models.Model):
     class Meta:
         verbose_name = "Победа игрока"
         verbose_name_plural = "Победы игроков"
+
+
+class ConfigVersion(models.Model):
+    """Counter of constance config changes, shared by the processes of every bot"""
+
+    version = models.PositiveIntegerField("Версия", default=0)
+
+    class Meta:
+        verbose_name = "Версия настроек"
+        verbose_name_plural = "Версии настроек"
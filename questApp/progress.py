@@ -0,0 +1,160 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, models
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from questApp.models import PlayersQuest
+from tgBot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of rows written by one UPDATE
+FLUSH_BATCH_SIZE = 500
+
+
+class ProgressBuffer:
+    """Write-behind buffer of 'PlayersQuest' step progress.
+
+    Current step and changed options are kept in memory and written by a
+    background thread in batched UPDATEs, so a player clicking through the
+    steps costs one write per flush instead of one per click. Unflushed
+    values are put on every 'PlayersQuest' loaded by this process.
+
+    Any regular 'PlayersQuest.save()' wins over the buffered values, so
+    wins, losses and restarts are still written synchronously.
+
+    :param enabled: 'False' makes 'save' write the row right away
+    :param interval: Seconds between flushes
+    """
+
+    def __init__(self, enabled, interval):
+        self.enabled = enabled
+        self.interval = interval
+        # pk -> (current_step_id, changed_options)
+        self._pending = {}
+        # Rows being written right now, they are still overlaid until committed
+        self._flushing = {}
+        self._lock = threading.Lock()
+        # Held while rows are written, so a synchronous save can't be overwritten
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def save(self, player_quest):
+        """Saves step progress of the 'player_quest' now or on the next flush"""
+        if not self.enabled:
+            player_quest.save(update_fields=PlayersQuest.STEP_FIELDS)
+            return
+
+        with self._lock:
+            self._pending[player_quest.pk] = (
+                player_quest.current_step_id,
+                bytes(player_quest.changed_options or b""),
+            )
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._flush_loop, name="progress-flush", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+        metrics.gauge("progress.pending", len(self._pending))
+
+    def overlay(self, player_quest):
+        """Puts unflushed progress on the just loaded 'player_quest'"""
+        entry = self._pending.get(player_quest.pk) or self._flushing.get(player_quest.pk)
+        if entry is not None:
+            player_quest.current_step_id, player_quest.changed_options = entry
+
+    def discard(self, pk):
+        """Drops buffered progress that is about to be overwritten by a regular save.
+
+        Waits for the flush writing the row, otherwise its stale UPDATE could
+        land after the save.
+        """
+        if pk not in self._pending and pk not in self._flushing:
+            return
+
+        with self._flush_lock, self._lock:
+            self._pending.pop(pk, None)
+
+    def write(self, pk):
+        """Writes buffered progress of the row right away, e.g. before a conditional UPDATE"""
+        if pk not in self._pending and pk not in self._flushing:
+            return
+
+        # A flush of the row is waited for, so its UPDATE is committed after it
+        with self._flush_lock:
+            with self._lock:
+                entry = self._pending.pop(pk, None)
+
+            if entry is None:
+                return
+
+            try:
+                self._write([(pk, entry)])
+            except Exception:
+                with self._lock:
+                    self._pending.setdefault(pk, entry)
+                raise
+
+        metrics.increment("progress.flushed")
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, {}
+
+            items = list(self._flushing.items())
+            try:
+                for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                    self._write(items[start : start + FLUSH_BATCH_SIZE])
+            except Exception:
+                # Newer progress of the same rows is kept over the failed one
+                with self._lock:
+                    for pk, entry in items:
+                        self._pending.setdefault(pk, entry)
+                raise
+            finally:
+                self._flushing = {}
+
+        metrics.increment("progress.flushed", len(items))
+        metrics.gauge("progress.pending", len(self._pending))
+
+    def _write(self, items):
+        # 'bulk_update' appeared in Django 2.2, the same UPDATE is built by hand
+        steps = [When(pk=pk, then=Value(step_id)) for pk, (step_id, _) in items]
+        options = [
+            When(pk=pk, then=Value(changed_options))
+            for pk, (_, changed_options) in items
+        ]
+
+        PlayersQuest.objects.filter(pk__in=[pk for pk, _ in items]).update(
+            current_step=Case(*steps, output_field=models.IntegerField()),
+            changed_options=Case(*options, output_field=models.BinaryField()),
+            date_changed=timezone.now(),
+        )
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                metrics.increment("progress.failed")
+                logger.exception("Progress flush failed")
+            finally:
+                close_old_connections()
+
+
+progress = ProgressBuffer(
+    enabled=settings.PROGRESS_WRITE_BEHIND["ENABLED"],
+    interval=settings.PROGRESS_WRITE_BEHIND["INTERVAL"],
+)
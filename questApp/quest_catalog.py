@@ -0,0 +1,42 @@
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+from django.conf import settings
+
+from questApp.models import Quest
+from tgBot.cache import TTLCache
+
+
+class QuestCatalog(NamedTuple):
+    """Every Quest loaded with one query, shared read-only by the threads"""
+
+    quests: Tuple[Quest, ...]
+    # Quest by its name, names of several quests are left out
+    by_name: Mapping[str, Quest]
+
+
+_catalog = TTLCache(timeout=settings.CACHING_TIMEOUTS["QUEST_CATALOG"]["TIMEOUT"])
+
+
+def load_catalog() -> QuestCatalog:
+    quests = tuple(Quest.objects.all())
+
+    by_name = {}
+    duplicates = set()
+    for quest in quests:
+        if quest.name in by_name:
+            duplicates.add(quest.name)
+        by_name[quest.name] = quest
+
+    for name in duplicates:
+        del by_name[name]
+
+    return QuestCatalog(quests=quests, by_name=MappingProxyType(by_name))
+
+
+def get_catalog() -> QuestCatalog:
+    return _catalog.get_or_set("quests", load_catalog)
+
+
+def invalidate():
+    _catalog.clear()
@@ -0,0 +1,205 @@
+import itertools
+import logging
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from questApp.models import Option, Step
+from questApp.step_parts import StepPart, get_duration, parse_description
+from tgBot.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledOption(NamedTuple):
+    id: int
+    text: str
+    next_step_id: Optional[int]
+    changes: FrozenSet[int]
+    is_hidden: bool
+    is_winning: bool
+    index: int
+    bit: int
+    # Bits of the Options from 'changes'
+    changes_mask: int
+
+
+class CompiledStep(NamedTuple):
+    id: int
+    quest_id: Optional[int]
+    description: str
+    image: Optional[str]
+    vk_image: Optional[str]
+    tg_image: Optional[str]
+    delay: float
+    is_first: bool
+    # Parsed description, see 'step_parts.parse_description'
+    parts: Tuple[StepPart, ...]
+    # Seconds from the first part to the last one
+    duration: float
+    # Ordered the same way as 'Step.options.all()'
+    options: Tuple[CompiledOption, ...]
+    options_by_text: Mapping[str, CompiledOption]
+    # Bits of the step's options, other 'PlayersQuest.toggles' don't affect the step
+    options_mask: int
+    # Unique number of the compilation the step comes from
+    revision: int
+
+    def find_option(self, text) -> Optional[CompiledOption]:
+        return self.options_by_text.get(text)
+
+
+class CompiledQuest(NamedTuple):
+    id: int
+    first_step_id: Optional[int]
+    steps: Mapping[int, CompiledStep]
+    options: Mapping[int, CompiledOption]
+
+    @property
+    def first_step(self) -> Optional[CompiledStep]:
+        return self.steps.get(self.first_step_id)
+
+    def get_step(self, step_id) -> Optional[CompiledStep]:
+        return self.steps.get(step_id)
+
+    def get_next_step(self, option) -> Optional[CompiledStep]:
+        return self.steps.get(option.next_step_id)
+
+
+_revisions = itertools.count(1)
+_quests = TTLCache(timeout=settings.CACHING_TIMEOUTS["QUEST"]["TIMEOUT"])
+
+
+def compile_quest(quest_id) -> CompiledQuest:
+    """Loads every Step reachable from the quest with their Options in a few queries"""
+    steps = {}
+    options = {}
+    step_options = {}
+    option_changes = {}
+
+    step_qs = Step.objects.filter(quest_id=quest_id)
+    while True:
+        new_steps = {step.pk: step for step in step_qs if step.pk not in steps}
+        if not new_steps:
+            break
+        steps.update(new_steps)
+
+        links = Step.options.through.objects.filter(step_id__in=new_steps)
+        new_option_ids = set()
+        for step_id, option_id in links.values_list("step_id", "option_id"):
+            step_options.setdefault(step_id, set()).add(option_id)
+            if option_id not in options:
+                new_option_ids.add(option_id)
+
+        new_options = {
+            option.pk: option for option in Option.objects.filter(pk__in=new_option_ids)
+        }
+        options.update(new_options)
+
+        changes = Option.changes.through.objects.filter(
+            from_option_id__in=new_options
+        ).values_list("from_option_id", "to_option_id")
+        for from_id, to_id in changes:
+            option_changes.setdefault(from_id, set()).add(to_id)
+
+        # Options may lead to Steps that don't belong to the quest itself
+        next_step_ids = {
+            option.next_step_id
+            for option in new_options.values()
+            if option.next_step_id and option.next_step_id not in steps
+        }
+        step_qs = Step.objects.filter(pk__in=next_step_ids)
+
+    bits = {option.pk: option.bit for option in options.values()}
+    missing_bits = {pk for ids in option_changes.values() for pk in ids} - set(bits)
+    if missing_bits:
+        bits.update(Option.objects.filter(pk__in=missing_bits).values_list("pk", "bit"))
+
+    compiled_options = {}
+    for option in options.values():
+        changes = frozenset(option_changes.get(option.pk, ()))
+        changes_mask = 0
+        for pk in changes:
+            changes_mask |= 1 << bits[pk]
+
+        compiled_options[option.pk] = CompiledOption(
+            id=option.pk,
+            text=option.text,
+            next_step_id=option.next_step_id,
+            changes=changes,
+            is_hidden=option.is_hidden,
+            is_winning=option.is_winning,
+            index=option.index,
+            bit=option.bit,
+            changes_mask=changes_mask,
+        )
+
+    revision = next(_revisions)
+    compiled_steps = {}
+    for step in steps.values():
+        step_compiled_options = sorted(
+            (compiled_options[pk] for pk in step_options.get(step.pk, ())),
+            key=lambda option: (option.text, option.id),
+        )
+        options_by_text = {}
+        options_mask = 0
+        for option in step_compiled_options:
+            options_by_text.setdefault(option.text, option)
+            options_mask |= 1 << option.bit
+
+        try:
+            parts = parse_description(step.description, step.delay)
+        except ValueError as exc:
+            # Saved before the description was validated, it's sent as a whole
+            logger.warning("Step %s has invalid description: %s", step.pk, exc)
+            parts = (StepPart(step.description, 0),)
+
+        compiled_steps[step.pk] = CompiledStep(
+            id=step.pk,
+            quest_id=step.quest_id,
+            description=step.description,
+            image=step.image,
+            vk_image=step.vk_image,
+            tg_image=step.tg_image,
+            delay=step.delay,
+            is_first=step.is_first,
+            parts=parts,
+            duration=get_duration(parts),
+            options=tuple(step_compiled_options),
+            options_by_text=MappingProxyType(options_by_text),
+            options_mask=options_mask,
+            revision=revision,
+        )
+
+    # Same Step as 'Quest.first_step' gives, it's ordered by description
+    first_steps = sorted(
+        (step.description, step.pk)
+        for step in steps.values()
+        if step.is_first and step.quest_id == quest_id
+    )
+    first_step_id = first_steps[0][1] if first_steps else None
+
+    return CompiledQuest(
+        id=quest_id,
+        first_step_id=first_step_id,
+        steps=MappingProxyType(compiled_steps),
+        options=MappingProxyType(compiled_options),
+    )
+
+
+def get_quest(quest_id) -> CompiledQuest:
+    """Returns compiled quest, it's built once and then served from memory"""
+    return _quests.get_or_set(quest_id, lambda: compile_quest(quest_id))
+
+
+def get_step(quest_id, step_id) -> Optional[CompiledStep]:
+    if not step_id:
+        return None
+
+    return get_quest(quest_id).get_step(step_id)
+
+
+def invalidate():
+    """Drops every compiled quest. Steps and Options may be shared between quests"""
+    _quests.clear()
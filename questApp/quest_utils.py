@@ -1,48 +1,87 @@
-import os
-import sys
-
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
-sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-import django
-
-django.setup()
-
-from constance import config
+from questApp.config_snapshot import config
 from django.conf import settings
-from questApp.models import Player, PlayersQuestCompleted, Quest
+from django.db import transaction
+from django.utils import timezone
+from questApp import quest_catalog, quest_graph
+from questApp.progress import progress
+from questApp.models import Player, PlayersQuest, PlayersQuestCompleted
+from player import cache as player_cache
+from tgBot.metrics import metrics
 
 
 def handle_option_message(player_quest, option):
-    # if player has active quest and it's paid
-    is_hidden = option.is_hidden
-
-    changes = player_quest.changes.all()
+    """Applies compiled 'option' to the 'player_quest'
 
-    if option in changes:
-        is_hidden = not is_hidden
+    :returns: '(is_winning, next_step)' with compiled next Step, 'None' if option is hidden
+        or another press of the player has been handled first
+    """
+    # if player has active quest and it's paid
+    is_hidden = not player_quest.is_option_visible(option)
 
     is_winning = False
+    is_ended = False
 
     if not is_hidden:
-        if option.next_step:
+        read_step_id = player_quest.current_step_id
+        next_step = quest_graph.get_step(player_quest.quest_id, option.next_step_id)
+
+        if next_step:
             # This Step is not last
-            option_changes = option.changes.all()
-            if option_changes:
-                for change in option_changes:
-                    player_quest.changes.add(change)
+            player_quest.apply_changes(option)
 
         if not player_quest.is_complete:
             if option.is_winning:
-                player_quest.won_game(option, save=False)
                 is_winning = True
-            elif not option.next_step:
+                is_ended = True
+            elif not next_step:
                 player_quest.lost_game(save=False)
+                is_ended = True
+
+        player_quest.set_current_step(next_step, save=False)
+
+        if is_ended or not progress.enabled:
+            # Buffered progress is written first, so the compare-and-set finds
+            # the step this press was read on. Outside of the transaction, as
+            # it stays written if the press loses
+            progress.write(player_quest.pk)
+
+        if is_winning:
+            with transaction.atomic():
+                player_quest.won_game(option, save=False)
+                is_saved = save_step(player_quest, read_step_id)
+                if not is_saved:
+                    # The win record of this press is dropped along with it
+                    transaction.set_rollback(True)
+        elif is_ended or not progress.enabled:
+            # Results are never left in the write-behind buffer
+            is_saved = save_step(player_quest, read_step_id)
+        else:
+            progress.save(player_quest)
+            is_saved = True
+
+        if not is_saved:
+            metrics.increment("options.conflicts")
+            return None
+
+        return is_winning, next_step
+
+
+def save_step(player_quest, read_step_id):
+    """Writes step fields of the 'player_quest' if it's still on the Step 'read_step_id'
+
+    Compare-and-set instead of a row lock: of two presses handled at once,
+    e.g. by two webhook processes, only the first one moves the player.
 
-        player_quest.set_current_step(option.next_step, save=False)
-        player_quest.save()
+    :returns: 'False' if the current step has been changed meanwhile
+    """
+    player_quest.date_changed = timezone.now()
 
-        return is_winning, option.next_step
+    fields = [player_quest._meta.get_field(name).attname for name in player_quest.STEP_FIELDS]
+    updated = PlayersQuest.objects.filter(
+        pk=player_quest.pk, current_step_id=read_step_id
+    ).update(**{field: getattr(player_quest, field) for field in fields})
+
+    return updated == 1
 
 
 def handle_contact_message(player, message):
@@ -50,60 +89,66 @@ def handle_contact_message(player, message):
     player.end_contact_saving()
 
 
-def get_all_quests(select_related=None, prefetch_related=None):
-    qs = Quest.objects.all()
+def get_all_quests():
+    return quest_catalog.get_catalog().quests
+
 
-    if select_related:
-        qs = qs.select_related(*select_related)
+def get_quest_by_name(name):
+    """Returns Quest from the catalog, 'None' if there is no or several quests with the name"""
+    return quest_catalog.get_catalog().by_name.get(name)
 
-    if prefetch_related:
-        qs = qs.prefetch_related(*prefetch_related)
 
-    return qs
+def load_player(**lookup):
+    """Returns the Player with his active quest and its Quest, one query"""
+    return Player.objects.select_related("active_quest__quest").filter(**lookup).first()
 
 
-def get_quest_by_name(name, select_related=None, prefetch_related=None):
-    try:
-        qs = Quest.objects
+def get_or_create_player(user_login, user_id, referred_by, player_type, first_name, second_name):
+    """Resolves player through the player cache, DB is written only if profile has changed
+
+    :returns: '(player, created)' like 'update_or_create' does
+    """
+    pk = player_cache.get_pk(player_type, user_id)
+    player = load_player(pk=pk) if pk else None
+
+    if not player:
+        player = load_player(user_id=user_id, player_type=player_type)
+
+        if not player:
+            player, created = Player.objects.get_or_create(
+                user_id=user_id,
+                player_type=player_type,
+                defaults={
+                    "first_name": first_name,
+                    "second_name": second_name,
+                    "user_login": user_login,
+                    "referred_by": referred_by,
+                },
+            )
+            if created:
+                return player, created
+
+        player_cache.remember(player)
+
+    profile = {"first_name": first_name, "second_name": second_name}
 
-        if select_related:
-            qs = qs.select_related(*select_related)
+    if user_login:
+        profile["user_login"] = user_login
 
-        if prefetch_related:
-            qs = qs.prefetch_related(*prefetch_related)
+    changed_fields = []
+    for name, value in profile.items():
+        if getattr(player, name) != value:
+            setattr(player, name, value)
+            changed_fields.append(name)
 
-        quest = qs.get(name=name)
-        return quest
-    except Quest.DoesNotExist:
-        return None
-    except Quest.MultipleObjectsReturned:
-        return None
+    if referred_by and player.referred_by_id != referred_by.pk:
+        player.referred_by = referred_by
+        changed_fields.append("referred_by")
 
+    if changed_fields:
+        player.save(update_fields=changed_fields)
 
-def get_or_create_player(user_login, user_id, referred_by, player_type, first_name, second_name):
-    if user_login:
-        player, created = Player.objects.update_or_create(
-            user_id=user_id,
-            player_type=player_type,
-            defaults={
-                "first_name": first_name,
-                "second_name": second_name,
-                "user_login": user_login,
-                "referred_by": referred_by,
-            },
-        )
-        return player, created
-    else:
-        player, created = Player.objects.update_or_create(
-            user_id=user_id,
-            player_type=player_type,
-            defaults={
-                "first_name": first_name,
-                "second_name": second_name,
-                "referred_by": referred_by,
-            },
-        )
-        return player, created
+    return player, False
 
 
 def menu_text_full(name):
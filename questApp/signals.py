@@ -0,0 +1,73 @@
+from constance.signals import config_updated
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from questApp import quest_catalog, quest_graph
+from questApp.config_snapshot import config
+from questApp.models import Option, PlayersQuest, Quest, Step
+from questApp.progress import progress
+
+
+@receiver([post_save, post_delete], sender=Quest)
+@receiver([post_save, post_delete], sender=Step)
+@receiver([post_save, post_delete], sender=Option)
+@receiver(m2m_changed, sender=Step.options.through)
+@receiver(m2m_changed, sender=Option.changes.through)
+def invalidate_quest_graph(sender, **kwargs):
+    quest_graph.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Quest)
+def invalidate_quest_catalog(sender, **kwargs):
+    quest_catalog.invalidate()
+
+
+@receiver(config_updated)
+def invalidate_config_snapshot(sender, **kwargs):
+    config.invalidate()
+
+
+@receiver(post_init, sender=PlayersQuest)
+def overlay_buffered_progress(sender, instance, **kwargs):
+    progress.overlay(instance)
+
+
+@receiver(pre_save, sender=PlayersQuest)
+def discard_buffered_progress(sender, instance, **kwargs):
+    progress.discard(instance.pk)
+
+
+# Image URL fields and the fields with their uploaded Telegram file_id and VK attachment
+UPLOADED_IMAGES = {
+    Quest: {
+        "image_descr": ("tg_image_descr", "vk_image_descr"),
+        "image_award": ("tg_image_award", "vk_image_award"),
+    },
+    Step: {"image": ("tg_image", "vk_image")},
+}
+
+
+@receiver(pre_save, sender=Quest)
+@receiver(pre_save, sender=Step)
+def reset_uploaded_images(sender, instance, update_fields=None, **kwargs):
+    """Drops saved file_id and attachment of the images whose URL is changed"""
+    fields = {
+        attr: uploaded_attrs
+        for attr, uploaded_attrs in UPLOADED_IMAGES[sender].items()
+        if update_fields is None or attr in update_fields
+    }
+    if not instance.pk or not fields:
+        return
+
+    saved = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    if saved:
+        for attr, uploaded_attrs in fields.items():
+            if saved[attr] != getattr(instance, attr):
+                for uploaded_attr in uploaded_attrs:
+                    setattr(instance, uploaded_attr, None)
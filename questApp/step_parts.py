@@ -0,0 +1,72 @@
+from typing import NamedTuple, Tuple
+
+PART_SEPARATOR = "_"
+DELAY_SEPARATOR = "~"
+ESCAPE = "\\"
+# Only the separators are escaped, other backslashes are text
+ESCAPED = (PART_SEPARATOR, DELAY_SEPARATOR)
+
+
+class StepPart(NamedTuple):
+    text: str
+    # Seconds after the previous part
+    delay: float
+
+
+def parse_description(description, delay) -> Tuple[StepPart, ...]:
+    """Splits Step description into parts sent one after another.
+
+    Parts are separated by "_", a part may end with "~<seconds>" to be sent
+    that long after the previous one instead of the default 'delay'.
+    The first part is sent right away. "\\_" and "\\~" stand for the characters
+    themselves, any other backslash is kept as it is.
+
+    :raises ValueError: If a delay is not a non-negative number
+    """
+    parts = []
+    text = []
+    delay_text = None
+
+    def add_part(text, delay_text):
+        if delay_text is None:
+            part_delay = delay
+        else:
+            try:
+                part_delay = float("".join(delay_text))
+            except ValueError:
+                raise ValueError(
+                    'Задержка части {} "{}" не число'.format(
+                        len(parts) + 1, "".join(delay_text)
+                    )
+                ) from None
+
+        if part_delay < 0:
+            raise ValueError("Задержка части {} меньше нуля".format(len(parts) + 1))
+
+        parts.append(StepPart("".join(text), part_delay if parts else 0))
+
+    index = 0
+    while index < len(description):
+        char = description[index]
+        index += 1
+
+        if char == ESCAPE and description[index:index + 1] in ESCAPED:
+            char = description[index]
+            index += 1
+        elif char == PART_SEPARATOR:
+            add_part(text, delay_text)
+            text, delay_text = [], None
+            continue
+        elif char == DELAY_SEPARATOR and delay_text is None:
+            delay_text = []
+            continue
+
+        (text if delay_text is None else delay_text).append(char)
+
+    add_part(text, delay_text)
+    return tuple(parts)
+
+
+def get_duration(parts) -> float:
+    """Seconds from the first part to the last one"""
+    return sum(part.delay for part in parts)
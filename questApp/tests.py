@@ -1,3 +1,399 @@
-from django.test import TestCase
+import importlib
+import threading
+from unittest import mock
 
-# Create your tests here.
+from constance import config as constance_config
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from player.models import Player
+from questApp import quest_catalog, quest_graph, quest_utils
+from questApp.config_snapshot import ConfigSnapshot
+from questApp.entitlements import Entitlements
+from questApp.models import (
+    Option,
+    PlayersQuest,
+    PlayersQuestCompleted,
+    Quest,
+    QuestPermittedPlayers,
+    Step,
+)
+from questApp.progress import ProgressBuffer
+from questApp.step_parts import StepPart, parse_description
+
+
+class ProgressBufferTests(TransactionTestCase):
+    def setUp(self):
+        quest = Quest.objects.create(name="Quest", max_attempts=10)
+        self.first_step = Step.objects.create(quest=quest, description="First", is_first=True)
+        self.buffered_step = Step.objects.create(quest=quest, description="Buffered")
+        self.player_quest = PlayersQuest.objects.create(
+            quest=quest, player=Player.objects.create(), current_step=self.first_step
+        )
+
+    def run_in_thread(self, target):
+        def run():
+            try:
+                target()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_save_during_flush_wins_over_flushed_progress(self):
+        buffer = ProgressBuffer(enabled=True, interval=3600)
+        write = buffer._write
+        writing = threading.Event()
+        resume = threading.Event()
+
+        def slow_write(items):
+            writing.set()
+            resume.wait(5)
+            write(items)
+
+        self.player_quest.current_step = self.buffered_step
+        with mock.patch.object(buffer, "_thread", object()):
+            buffer.save(self.player_quest)
+
+        with mock.patch.object(buffer, "_write", slow_write), mock.patch(
+            "questApp.signals.progress", buffer
+        ):
+            flushing = self.run_in_thread(buffer.flush)
+            self.assertTrue(writing.wait(5))
+
+            def finish_game():
+                player_quest = PlayersQuest.objects.get(pk=self.player_quest.pk)
+                player_quest.current_step = self.first_step
+                player_quest.is_complete = True
+                player_quest.save()
+
+            saving = self.run_in_thread(finish_game)
+            # The save waits for the flush writing the same row
+            saving.join(0.2)
+            self.assertTrue(saving.is_alive())
+
+            resume.set()
+            flushing.join(5)
+            saving.join(5)
+
+        saved = PlayersQuest.objects.get(pk=self.player_quest.pk)
+        self.assertEqual(saved.current_step_id, self.first_step.id)
+        self.assertTrue(saved.is_complete)
+
+
+class HandleOptionMessageTests(TransactionTestCase):
+    def test_only_first_of_concurrent_presses_moves_player(self):
+        quest = Quest.objects.create(name="Quest", max_attempts=10)
+        step = Step.objects.create(quest=quest, description="First", is_first=True)
+        option = Option.objects.create(text="Win", quest=quest, is_winning=True)
+        step.options.add(option)
+        player_quest = PlayersQuest.objects.create(
+            quest=quest, player=Player.objects.create(), current_step=step
+        )
+        compiled_option = quest_graph.get_step(quest.pk, step.pk).find_option("Win")
+
+        # Both presses have read the PlayersQuest before either of them is saved
+        first = PlayersQuest.objects.get(pk=player_quest.pk)
+        second = PlayersQuest.objects.get(pk=player_quest.pk)
+
+        self.assertEqual(
+            quest_utils.handle_option_message(first, compiled_option), (True, None)
+        )
+        self.assertIsNone(quest_utils.handle_option_message(second, compiled_option))
+
+        saved = PlayersQuest.objects.get(pk=player_quest.pk)
+        self.assertEqual(saved.attempts_num, 1)
+        self.assertTrue(saved.is_complete)
+        self.assertEqual(PlayersQuestCompleted.objects.count(), 1)
+
+    def test_winning_press_after_buffered_press(self):
+        quest = Quest.objects.create(name="Quest", max_attempts=10)
+        first_step = Step.objects.create(quest=quest, description="First", is_first=True)
+        last_step = Step.objects.create(quest=quest, description="Last")
+        next_option = Option.objects.create(text="Next", quest=quest, next_step=last_step)
+        win_option = Option.objects.create(text="Win", quest=quest, is_winning=True)
+        first_step.options.add(next_option)
+        last_step.options.add(win_option)
+        player_quest = PlayersQuest.objects.create(
+            quest=quest, player=Player.objects.create(), current_step=first_step
+        )
+        buffer = ProgressBuffer(enabled=True, interval=3600)
+
+        with mock.patch.object(buffer, "_thread", object()), mock.patch.object(
+            quest_utils, "progress", buffer
+        ), mock.patch("questApp.signals.progress", buffer):
+            quest_utils.handle_option_message(
+                PlayersQuest.objects.get(pk=player_quest.pk),
+                quest_graph.get_step(quest.pk, first_step.pk).find_option("Next"),
+            )
+            # The press is only buffered
+            self.assertEqual(
+                PlayersQuest.objects.values_list("current_step", flat=True).get(),
+                first_step.id,
+            )
+
+            self.assertEqual(
+                quest_utils.handle_option_message(
+                    PlayersQuest.objects.get(pk=player_quest.pk),
+                    quest_graph.get_step(quest.pk, last_step.pk).find_option("Win"),
+                ),
+                (True, None),
+            )
+
+        self.assertEqual(buffer._pending, {})
+        saved = PlayersQuest.objects.get(pk=player_quest.pk)
+        self.assertIsNone(saved.current_step_id)
+        self.assertTrue(saved.is_complete)
+        self.assertEqual(PlayersQuestCompleted.objects.count(), 1)
+
+
+class OptionBitTests(TestCase):
+    def setUp(self):
+        self.quests = [Quest.objects.create(name=name) for name in ("First", "Second")]
+
+    def test_bits_are_unique_over_quests(self):
+        options = [
+            Option.objects.create(text=str(number), quest=self.quests[number % 2])
+            for number in range(4)
+        ]
+
+        self.assertEqual([option.bit for option in options], [0, 1, 2, 3])
+
+    def test_apply_changes_toggles_only_changed_options(self):
+        step = Step.objects.create(quest=self.quests[0], description="Step", is_first=True)
+        # Leads to a Step of another quest, its Options share the toggles
+        other_step = Step.objects.create(quest=self.quests[1], description="Other")
+        hidden = Option.objects.create(text="Hidden", quest=self.quests[0], is_hidden=True)
+        shown = Option.objects.create(text="Shown", quest=self.quests[1])
+        switch = Option.objects.create(
+            text="Switch", quest=self.quests[0], next_step=other_step
+        )
+        switch.changes.add(hidden, shown)
+        step.options.add(hidden, switch)
+        other_step.options.add(shown)
+
+        compiled = quest_graph.get_quest(self.quests[0].pk)
+        player_quest = PlayersQuest(quest=self.quests[0])
+        self.assertFalse(player_quest.is_option_visible(compiled.options[hidden.pk]))
+        self.assertTrue(player_quest.is_option_visible(compiled.options[shown.pk]))
+
+        player_quest.apply_changes(compiled.options[switch.pk])
+
+        self.assertEqual(player_quest.toggles, 1 << hidden.bit | 1 << shown.bit)
+        self.assertTrue(player_quest.is_option_visible(compiled.options[hidden.pk]))
+        self.assertFalse(player_quest.is_option_visible(compiled.options[shown.pk]))
+        self.assertTrue(player_quest.is_option_visible(compiled.options[switch.pk]))
+
+
+class ChangedOptionsMigrationTests(TransactionTestCase):
+    migration_name = "0015_playersquest_changed_options"
+
+    def setUp(self):
+        with override_settings(MIGRATION_MODULES={}):
+            state = MigrationLoader(None, ignore_no_migrations=True).project_state(
+                ("questApp", self.migration_name), at_end=False
+            )
+        self.apps = state.apps
+        # The M2M is dropped by the next migration, its table is made for the test
+        self.through = self.apps.get_model("questApp", "PlayersQuest").changes.through
+        with connection.schema_editor() as editor:
+            editor.create_model(self.through)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            editor.delete_model(self.through)
+
+    def test_changes_become_bits_unique_over_quests(self):
+        quests = [Quest.objects.create(name=name) for name in ("First", "Second")]
+        options = [
+            Option.objects.create(text=str(number), quest=quests[number % 2])
+            for number in range(4)
+        ]
+        # Bits as they were numbered per quest
+        for option in options:
+            Option.objects.filter(pk=option.pk).update(bit=None)
+        player_quest = PlayersQuest.objects.create(
+            quest=quests[1], player=Player.objects.create()
+        )
+        self.through.objects.create(playersquest_id=player_quest.pk, option_id=options[1].pk)
+        self.through.objects.create(playersquest_id=player_quest.pk, option_id=options[2].pk)
+
+        migration = importlib.import_module("questApp.migrations." + self.migration_name)
+        migration.changes_to_bits(self.apps, None)
+
+        self.assertEqual(
+            list(Option.objects.order_by("pk").values_list("bit", flat=True)), [0, 1, 2, 3]
+        )
+        self.assertEqual(PlayersQuest.objects.get().toggles, 0b110)
+
+
+class ConfigSnapshotTests(TestCase):
+    def setUp(self):
+        # Snapshots of two processes, the second one checks the version on every read
+        self.snapshot = ConfigSnapshot(timeout=None)
+        self.other_snapshot = ConfigSnapshot(timeout=0)
+        self.snapshot.MY_GAMES
+        self.other_snapshot.MY_GAMES
+
+    def test_values_are_served_from_memory(self):
+        with self.assertNumQueries(0):
+            self.snapshot.MY_GAMES
+
+    def test_unchanged_config_is_checked_with_one_query(self):
+        with self.assertNumQueries(1):
+            self.other_snapshot.MY_GAMES
+
+    def test_change_is_seen_by_other_process(self):
+        # Bumps the shared version through the 'config_updated' signal
+        constance_config.MY_GAMES = "Changed"
+
+        self.assertEqual(self.other_snapshot.MY_GAMES, "Changed")
+        self.assertNotEqual(self.other_snapshot.get_version(), 0)
+
+    def test_processes_share_the_version(self):
+        version = self.other_snapshot.get_version()
+
+        self.snapshot.invalidate()
+
+        self.assertEqual(self.snapshot.get_version(), version + 1)
+        self.assertEqual(self.other_snapshot.get_version(), version + 1)
+
+
+class ParseDescriptionTests(SimpleTestCase):
+    def test_parts_are_sent_with_their_delays(self):
+        self.assertEqual(
+            parse_description("one_two~2.5_three", 1),
+            (StepPart("one", 0), StepPart("two", 2.5), StepPart("three", 1)),
+        )
+
+    def test_escaped_separators_are_text(self):
+        self.assertEqual(
+            parse_description(r"snake\_case\~1_next", 1),
+            (StepPart("snake_case~1", 0), StepPart("next", 1)),
+        )
+
+    def test_other_backslashes_are_kept(self):
+        self.assertEqual(
+            parse_description(r"C:\quests\new ¯\\(ツ)/¯ \n", 1),
+            (StepPart(r"C:\quests\new ¯\\(ツ)/¯ \n", 0),),
+        )
+
+    def test_trailing_backslash_is_kept(self):
+        self.assertEqual(parse_description("end\\", 1), (StepPart("end\\", 0),))
+
+    def test_invalid_delay_is_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_description("one_two~soon", 1)
+
+        with self.assertRaises(ValueError):
+            parse_description("one_two~-1", 1)
+
+
+class CompileQuestTests(TestCase):
+    def setUp(self):
+        quest_graph.invalidate()
+        self.quest = Quest.objects.create(name="Quest")
+        other_quest = Quest.objects.create(name="Other")
+        self.first_step = Step.objects.create(
+            quest=self.quest, description="One_Two~3", is_first=True
+        )
+        # Reached through an Option only, it belongs to another quest
+        self.other_step = Step.objects.create(quest=other_quest, description="Other")
+        self.right = Option.objects.create(
+            text="Right", quest=self.quest, next_step=self.other_step
+        )
+        self.left = Option.objects.create(text="Left", quest=self.quest, is_hidden=True)
+        self.right.changes.add(self.left)
+        self.first_step.options.add(self.right, self.left)
+
+    def test_reachable_steps_are_compiled(self):
+        compiled = quest_graph.compile_quest(self.quest.pk)
+
+        self.assertEqual(compiled.first_step_id, self.first_step.pk)
+        self.assertEqual(set(compiled.steps), {self.first_step.pk, self.other_step.pk})
+        self.assertEqual(
+            compiled.get_next_step(compiled.options[self.right.pk]).id, self.other_step.pk
+        )
+
+    def test_step_is_compiled_for_lookups(self):
+        step = quest_graph.compile_quest(self.quest.pk).first_step
+
+        self.assertEqual([option.text for option in step.options], ["Left", "Right"])
+        self.assertEqual(step.find_option("Right").id, self.right.pk)
+        self.assertIsNone(step.find_option("Up"))
+        self.assertEqual(step.options_mask, 1 << self.right.bit | 1 << self.left.bit)
+        self.assertEqual(step.find_option("Right").changes_mask, 1 << self.left.bit)
+        self.assertEqual([part.text for part in step.parts], ["One", "Two"])
+        self.assertEqual(step.duration, 3)
+
+    def test_invalid_description_is_sent_as_a_whole(self):
+        Step.objects.filter(pk=self.other_step.pk).update(description="One~soon_Two")
+
+        with self.assertLogs("questApp.quest_graph", "WARNING"):
+            step = quest_graph.compile_quest(self.quest.pk).get_step(self.other_step.pk)
+
+        self.assertEqual([part.text for part in step.parts], ["One~soon_Two"])
+
+    def test_quest_is_served_from_memory_until_changed(self):
+        compiled = quest_graph.get_quest(self.quest.pk)
+
+        with self.assertNumQueries(0):
+            self.assertIs(quest_graph.get_quest(self.quest.pk), compiled)
+            self.assertIsNone(quest_graph.get_step(self.quest.pk, None))
+
+        self.other_step.description = "Changed"
+        self.other_step.save()
+
+        step = quest_graph.get_step(self.quest.pk, self.other_step.pk)
+        self.assertEqual(step.description, "Changed")
+        self.assertNotEqual(step.revision, compiled.first_step.revision)
+
+
+class EntitlementsTests(TestCase):
+    def setUp(self):
+        quest_catalog.invalidate()
+        self.player = Player.objects.create(user_id="1")
+        self.free = Quest.objects.create(name="Free", is_active=True)
+        self.paid = Quest.objects.create(name="Paid", is_active=True, price=100)
+        self.inactive = Quest.objects.create(name="Inactive")
+        self.sale_ended = Quest.objects.create(
+            name="Sale ended", is_active=True, price=100, date_sale_end=timezone.now()
+        )
+
+    def test_permissions_are_read_once(self):
+        QuestPermittedPlayers.objects.create(quest=self.paid, player=self.player)
+        entitlements = Entitlements(self.player)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(entitlements.is_paid(self.paid))
+            self.assertTrue(entitlements.can_play_paid(self.paid))
+            self.assertFalse(entitlements.is_paid(self.sale_ended))
+
+    def test_free_quest_needs_no_permission(self):
+        entitlements = Entitlements(self.player)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(entitlements.can_play_paid(self.free))
+
+        self.assertTrue(entitlements.can_play(self.paid))
+        self.assertFalse(entitlements.can_play_paid(self.paid))
+
+    def test_available_quests(self):
+        QuestPermittedPlayers.objects.create(quest=self.sale_ended, player=self.player)
+
+        self.assertEqual(
+            Entitlements(self.player).get_available_quests(),
+            [self.free, self.paid, self.sale_ended],
+        )
+
+    def test_staff_plays_every_quest(self):
+        self.player.is_staff = True
+        entitlements = Entitlements(self.player)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(entitlements.can_play_paid(self.inactive))
+            self.assertTrue(entitlements.can_play_paid(self.sale_ended))
@@ -0,0 +1,324 @@
+from tgAPI import utils as tg_utils
+
+from questApp.config_snapshot import config
+from payment import payments
+from questApp import quest_utils
+from questApp.entitlements import Entitlements
+from questApp.models import Quest
+from tgBot.bots import BaseBot, commands
+
+
+class TGBot(BaseBot):
+    def __init__(self, message, bot, update, scheduler, args=None):
+        self.message = message
+        self.bot = bot
+        self.update = update
+        self.scheduler = scheduler
+        self.player, self.is_created = tg_utils.get_or_create_player(bot, update, args)
+        self.entitlements = Entitlements(self.player)
+
+    def send_quest_info(self, player_quest):
+        if not self.entitlements.is_paid(player_quest.quest):
+            payment_url = payments.make_payment(
+                self.player.id, player_quest.quest.id, player_quest.quest.price
+            )
+            if payment_url:
+                self.start_main_menu(text=config.BUY_LINK_TEXT + payment_url)
+            else:
+                self.start_main_menu(text=config.BUY_ERROR)
+
+        awarding_description = (
+            config.QUEST_IS_ON_AWARDING + "\n" + player_quest.quest.awarding_descr
+            if player_quest.quest.is_awarding
+            else ""
+        )
+        quest_description = (
+            config.QUEST_DESCRIPTION + "\n" + player_quest.quest.description
+        )
+
+        if awarding_description:
+            if player_quest.quest.image_award:
+                tg_utils.send_cached_photo(
+                    self.bot,
+                    self.update.message.chat_id,
+                    Quest,
+                    player_quest.quest.pk,
+                    "image_award",
+                    player_quest.quest.image_award,
+                    file_id=player_quest.quest.tg_image_award,
+                )
+
+            self.bot.send_message(self.update.message.chat_id, awarding_description)
+
+        if quest_description:
+            if player_quest.quest.image_descr:
+                tg_utils.send_cached_photo(
+                    self.bot,
+                    self.update.message.chat_id,
+                    Quest,
+                    player_quest.quest.pk,
+                    "image_descr",
+                    player_quest.quest.image_descr,
+                    file_id=player_quest.quest.tg_image_descr,
+                )
+
+            self.bot.send_message(self.update.message.chat_id, quest_description)
+
+    def start_main_menu(self, text=None):
+        if text is None:
+            text = config.MAIN_MENU_TEXT
+        player_quests = self.player.has_quests or self.player.is_staff
+        reply_markup = tg_utils.get_menu_keyboard(
+            "MAIN" if player_quests else "MAIN_WO_GAMES"
+        )
+
+        self.bot.send_message(
+            self.update.message.chat_id, text, reply_markup=reply_markup
+        )
+
+    def start_my_quests_menu(self):
+        player_quests = self.player.get_my_quests(select_related=("quest",))
+        if player_quests:
+            reply_markup = tg_utils.get_list_keyboard(
+                commands["GAME"] + " " + player_quest.quest.name
+                for player_quest in player_quests
+                if self.entitlements.can_play_paid(player_quest.quest)
+            )
+
+            self.bot.send_message(
+                self.update.effective_chat.id,
+                config.PLAYER_QUESTS_LIST,
+                reply_markup=reply_markup,
+            )
+
+    def start_all_quests_menu(self):
+        quests = self.entitlements.get_available_quests()
+        reply_markup = tg_utils.get_list_keyboard(
+            commands["GAME"] + " " + quest.name for quest in quests
+        )
+
+        self.bot.send_message(
+            self.update.effective_chat.id, config.QUESTS_ALL, reply_markup=reply_markup,
+        )
+
+    def start_ask_to_start_menu(self):
+        reply_markup = tg_utils.get_menu_keyboard("ASK_TO_START")
+        self.bot.send_message(
+            self.update.effective_chat.id,
+            config.GAME_START_BUTTON
+            + ' "'
+            + quest_utils.menu_text_full("START_GAME")
+            + '"',
+            reply_markup=reply_markup,
+        )
+
+    def start_ask_to_restart_menu(self):
+        reply_markup = tg_utils.get_menu_keyboard("ASK_TO_RESTART")
+        self.bot.send_message(
+            self.update.effective_chat.id,
+            config.QUEST_CONFIRM_RESTART,
+            reply_markup=reply_markup,
+        )
+
+    def start_confirm_restart_menu(self):
+        active_quest = self.player.get_active_quest(select_related=("quest",))
+
+        if active_quest:
+            if not active_quest.is_attempts_exceeded:
+                if self.entitlements.is_paid(active_quest.quest):
+                    active_quest.clear_game()
+
+                    if self.entitlements.can_play_paid(active_quest.quest):
+                        self.start_playerquest(active_quest, active_quest.quest)
+                    else:
+                        self.start_main_menu(text=config.QUEST_IS_NOT_AVAILABLE)
+                else:
+                    self.send_quest_info(active_quest)
+            else:
+                self.start_main_menu(text=config.QUEST_ATTEMPTS_EXCEEDED)
+
+    def start_game_menu(self):
+        active_quest = self.player.get_active_quest(select_related=("quest",))
+
+        if active_quest:
+            tg_utils.build_step(
+                bot=self.bot,
+                update=self.update,
+                step=active_quest.get_current_step(),
+                scheduler=self.scheduler,
+                player_quest=active_quest,
+            )
+
+    def start_settings_menu(self):
+        active_quest = self.player.get_active_quest(select_related=("quest",))
+
+        if active_quest:
+            reply_markup = tg_utils.get_menu_keyboard("SETTINGS_PLAYING")
+            reply_text = (
+                config.PLAYER_PLAYING
+                + ' "'
+                + active_quest.quest.name
+                + '"\n\n'
+                + config.PLAYER_REFERRAL
+                + "\n"
+                + self.player.referral_link
+            )
+        else:
+            reply_markup = tg_utils.get_menu_keyboard("SETTINGS")
+            reply_text = config.PLAYER_NO_QUESTS
+
+        self.bot.send_message(
+            self.update.message.chat_id, reply_text, reply_markup=reply_markup
+        )
+
+    def start_cancel_contact_menu(self):
+        if self.player.is_next_message_contact:
+            self.player.end_contact_saving()
+
+        self.start_main_menu()
+
+    def start_add_contact_menu(self):
+        self.player.start_contact_saving()
+        contact = self.player.add_contact
+        text = ""
+        if contact:
+            text = config.PLAYER_CONTACT + " " + contact + "\n"
+
+        reply_markup = tg_utils.get_menu_keyboard("CANCEL_CONTACT")
+
+        self.bot.send_message(
+            self.update.message.chat_id,
+            text + config.PLAYER_CONTACT_SET,
+            reply_markup=reply_markup,
+        )
+
+    def handle_game_title(self):
+        # remove emoji and space
+        self.message = self.message.replace(commands["GAME"] + " ", "")
+        quest = quest_utils.get_quest_by_name(name=self.message)
+
+        if quest:
+            if self.entitlements.can_play(quest):
+                active_quest = self.player.get_active_quest(select_related=("quest",))
+
+                if active_quest:
+                    # Player has active quest
+                    current_step = active_quest.get_current_step()
+
+                    if active_quest.quest.name == quest.name:
+                        # Player chooses his active quest
+                        if current_step:
+                            # Player quest is not ended, so just continue
+                            if self.entitlements.is_paid(active_quest.quest):
+                                tg_utils.build_step(
+                                    self.bot,
+                                    self.update,
+                                    current_step,
+                                    self.scheduler,
+                                    active_quest,
+                                )
+                            else:
+                                self.send_quest_info(active_quest)
+                        else:
+                            # Quest ended, so suggest to replay it
+                            if self.entitlements.is_paid(active_quest.quest):
+                                reply_markup = tg_utils.get_menu_keyboard(
+                                    "QUEST_ENDED"
+                                )
+
+                                self.bot.send_message(
+                                    self.update.message.chat_id,
+                                    config.QUEST_ASK_RESTART
+                                    + ' "'
+                                    + quest_utils.menu_text_full("CONFIRM_TO_RESTART")
+                                    + '"',
+                                    reply_markup=reply_markup,
+                                )
+                            else:
+                                self.send_quest_info(active_quest)
+                    else:
+                        # Player chooses another quest
+                        player_quest = self.player.get_quest_by_pk(quest=quest)
+                        self.start_playerquest(player_quest, quest)
+                else:
+                    # Player has no active quest and chooses one to start
+                    new_player_quest = self.player.get_quest_by_pk(quest)
+                    self.start_playerquest(new_player_quest, quest)
+            else:
+                self.start_main_menu(text=config.QUEST_IS_NOT_AVAILABLE)
+
+    def start_playerquest(self, player_quest, quest):
+        if player_quest:
+            # Player has PlayerQuest object of that quest
+            if self.entitlements.is_paid(player_quest.quest):
+                player_quest.set_active()
+                tg_utils.build_step(
+                    self.bot,
+                    self.update,
+                    player_quest.get_current_step(),
+                    self.scheduler,
+                    player_quest,
+                )
+            else:
+                self.send_quest_info(player_quest)
+        else:
+            # Player has no PlayerQuest object of that quest
+            player_quest = self.player.create_player_quest(quest)
+            self.send_quest_info(player_quest)
+            self.start_ask_to_start_menu()
+
+    def handle_game_option(self):
+        # Message is Option text or Unknown command
+        if self.player.is_next_message_contact:
+            quest_utils.handle_contact_message(self.player, self.message)
+            self.start_main_menu(text=config.PLAYER_CONTACT_SET_DONE)
+        else:
+            player_quest = self.player.get_active_quest(select_related=("quest",))
+
+            if player_quest and self.entitlements.can_play(player_quest.quest):
+                # Player has active quest
+                if self.entitlements.is_paid(player_quest.quest):
+                    # if player has active quest and it's paid
+                    current_step = player_quest.get_current_step()
+
+                    if current_step:
+                        # Quest is not done
+                        option = current_step.find_option(self.message)
+
+                        if option:
+                            result = quest_utils.handle_option_message(player_quest, option)
+
+                            if result:
+                                is_winning, current_step = result
+                                result_text = (
+                                    config.GAME_WIN_TEXT
+                                    if is_winning
+                                    else config.GAME_LOST_TEXT
+                                )
+
+                                tg_utils.build_step(
+                                    self.bot,
+                                    self.update,
+                                    current_step,
+                                    self.scheduler,
+                                    player_quest,
+                                    text=result_text,
+                                )
+                else:
+                    self.send_quest_info(player_quest)
+                    # Not paid or Unknown command
+
+    COMMAND_TABLE = {
+        "MY_GAMES": start_my_quests_menu,
+        "ALL_GAMES": start_all_quests_menu,
+        "MAIN_MENU": start_main_menu,
+        "ASK_TO_RESTART": start_ask_to_restart_menu,
+        "CONFIRM_TO_RESTART": start_confirm_restart_menu,
+        "RETURN_TO_GAME": start_game_menu,
+        # "START_WO_REFERRER":
+        "START_GAME": start_game_menu,
+        "SETTINGS": start_settings_menu,
+        "CANCEL_CONTACT": start_cancel_contact_menu,
+        "ADD_CONTACT": start_add_contact_menu,
+        "GAME": handle_game_title,
+    }
@@ -1,44 +1,42 @@
-import os
-import sys
-import django
-
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
-sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-django.setup()
-
 import telegram.bot
 import logging
+import threading
+from functools import partial, wraps
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from telegram.utils.request import Request
-from telegram.ext import messagequeue as mq
-from constance import config
+from questApp.config_snapshot import config
 
-from questApp import quest_utils
-from tgBot.bots import TGBot
+from tgAPI.bot import TGBot
+from tgBot.delivery import DeliveryScheduler
+from tgBot.executor import KeyedExecutor
+from tgBot.metrics import metrics
+from tgBot import runtime
 from tgAPI import utils
+from tgAPI.sender import TgSender
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
-from telegram import KeyboardButton, ReplyKeyboardMarkup
-
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
 
 logger = logging.getLogger(__name__)
 
 ACCESS_TOKEN = settings.TG_ACCESS_TOKEN
 
+_executor = None
+_scheduler = None
+_executor_lock = threading.Lock()
+
 
 def error(bot, update, err):
     """Log Errors caused by Updates."""
     logger.warning('Update "%s" caused error "%s"', update, err)
 
 
-def incoming_commands(bot, update, job_queue):
+def incoming_commands(bot, update):
     message = update.message.text
-    bot_ctx = TGBot(message, bot, update, job_queue)
+    scheduler = get_scheduler(bot)
+    # Parts of the previous Step are not sent once the player has answered
+    scheduler.cancel(update.effective_chat.id)
+    bot_ctx = TGBot(message, bot, update, scheduler)
 
     # Get command and run
     command = TGBot.get_command(message, bot_ctx)
@@ -47,72 +45,142 @@ def incoming_commands(bot, update, job_queue):
 
 
 def start_main_menu(bot, update, args=None):
+    get_scheduler(bot).cancel(update.effective_chat.id)
     player, _ = utils.get_or_create_player(bot, update, args=args)
     player_quests = player.has_quests
 
-    if player_quests:
-        button_list = [
-            KeyboardButton(quest_utils.menu_text_full("MY_GAMES")),
-            KeyboardButton(quest_utils.menu_text_full("ALL_GAMES")),
-            KeyboardButton(quest_utils.menu_text_full("SETTINGS")),
-        ]
-    else:
-        button_list = [
-            KeyboardButton(quest_utils.menu_text_full("ALL_GAMES")),
-            KeyboardButton(quest_utils.menu_text_full("SETTINGS")),
-        ]
-
-    reply_markup = ReplyKeyboardMarkup(
-        utils.build_menu(button_list, n_cols=1), resize_keyboard=True
-    )
+    reply_markup = utils.get_menu_keyboard("MAIN" if player_quests else "MAIN_WO_GAMES")
     bot.send_message(update.message.chat_id, config.MAIN_MENU_TEXT, reply_markup=reply_markup)
 
 
 class MQBot(telegram.bot.Bot):
-    """A subclass of Bot which delegates send method handling to MQ"""
+    """A subclass of Bot which delegates every send_* method to TgSender.
 
-    def __init__(self, *args, is_queued_def=True, mqueue=None, **kwargs):
+    Wrapped methods return a Future of the sent Message.
+    """
+
+    def __init__(self, *args, sender=None, **kwargs):
         super(MQBot, self).__init__(*args, **kwargs)
-        # below 2 attributes should be provided for decorator usage
-        self._is_messages_queued_default = is_queued_def
-        self._msg_queue = mqueue or mq.MessageQueue()
+        self._sender = sender or TgSender(
+            rate=settings.TG_SENDER["RATE"],
+            peer_rate=settings.TG_SENDER["PEER_RATE"],
+            peer_burst=settings.TG_SENDER["PEER_BURST"],
+            queue_size=settings.TG_SENDER["QUEUE_SIZE"],
+            max_attempts=settings.TG_SENDER["MAX_ATTEMPTS"],
+        )
 
-    def __del__(self):
-        try:
-            self._msg_queue.stop()
-        except:
-            pass
-        super(MQBot, self).__del__()
 
-    @mq.queuedmessage
-    def send_message(self, *args, **kwargs):
-        """Wrapped method would accept new `queued` and `isgroup`
-        OPTIONAL arguments"""
-        return super(MQBot, self).send_message(*args, **kwargs)
+def _queued(method):
+    @wraps(method)
+    def send(self, *args, **kwargs):
+        chat_id = args[0] if args else kwargs.get("chat_id")
+        return self._sender.send(chat_id, method, (self,) + args, kwargs)
 
+    return send
 
-def main():
-    # Create the EventHandler and pass it your bot's token.
-    print("server is starting...")
+
+for _name in dir(telegram.bot.Bot):
+    if _name.startswith("send_"):
+        setattr(MQBot, _name, _queued(getattr(telegram.bot.Bot, _name)))
+
+
+def get_executor():
+    """Returns worker pool of this process, it's shared by polling and webhook"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = KeyedExecutor(
+                "tg",
+                workers=settings.WORKER_POOLS["TG"]["WORKERS"],
+                queue_size=settings.WORKER_POOLS["TG"]["QUEUE_SIZE"],
+            )
+            _executor.start()
+            metrics.start_reporting(settings.METRICS_REPORT_INTERVAL)
+
+    return _executor
+
+
+def get_scheduler(bot):
+    """Returns delivery of delayed Step parts of this process"""
+    global _scheduler
+
+    executor = get_executor()
+    with _executor_lock:
+        if _scheduler is None:
+            if runtime.count_processes() > 1:
+                logger.warning(
+                    "The webhook is served by %s processes, delayed Step parts "
+                    "are cancelled only by the updates of the same process",
+                    runtime.count_processes(),
+                )
+            _scheduler = DeliveryScheduler(
+                "tg-delivery", send=partial(utils.send_message, bot), executor=executor
+            )
+
+    return _scheduler
+
+
+def in_chat_lane(callback):
+    """Runs the handler in the lane of the chat.
+
+    Updates of one chat are handled one by one, so presses of the same player
+    don't race on his PlayersQuest, while other chats run in parallel. Lanes
+    belong to the process: with several webhook processes the step is guarded
+    by the compare-and-set in 'quest_utils.save_step' instead.
+    """
+
+    def handler(bot, update, **kwargs):
+        get_executor().submit(update.effective_chat.id, callback, bot, update, **kwargs)
+
+    return handler
+
+
+def create_bot(sender=None):
     request = Request(con_pool_size=20, proxy_url=settings.TG_PROXY_URL)
-    bot = MQBot(ACCESS_TOKEN, request=request)
-    updater = Updater(bot=bot, workers=10)
-    # Get the dispatcher to register handlers
-    dp = updater.dispatcher
+    return MQBot(
+        ACCESS_TOKEN, base_url=settings.TG_BASE_URL, request=request, sender=sender
+    )
+
 
+def add_handlers(dp):
     # simple start function
-    dp.add_handler(CommandHandler("start", start_main_menu, pass_args=True))
+    dp.add_handler(
+        CommandHandler("start", in_chat_lane(start_main_menu), pass_args=True)
+    )
 
-    dp.add_handler(MessageHandler(Filters.all, incoming_commands, pass_job_queue=True))
+    dp.add_handler(MessageHandler(Filters.all, in_chat_lane(incoming_commands)))
 
     # log all errors
     dp.add_error_handler(error)
 
-    # Start the Bot
+
+def set_webhook():
+    """Makes Telegram push updates to 'tgAPI.views.telegram_webhook'"""
+    if not settings.TG_WEBHOOK_URL or not settings.TG_WEBHOOK_URL.startswith("https://"):
+        raise ImproperlyConfigured(
+            "Set TG_WEBHOOK_URL to the https:// URL of the webhook view, "
+            "Telegram doesn't accept other webhooks"
+        )
+    if not settings.TG_WEBHOOK_TOKEN:
+        raise ImproperlyConfigured("Set TG_WEBHOOK_TOKEN, it's the secret part of the URL")
+
+    bot = create_bot()
+    bot.set_webhook(url=settings.TG_WEBHOOK_URL + settings.TG_WEBHOOK_TOKEN + "/")
+    print("webhook is set!")
+
+
+def main():
+    # Create the EventHandler and pass it your bot's token.
+    print("server is starting...")
+    bot = create_bot()
+    # Handlers only hand updates over to the chat lanes, so the dispatcher
+    # needs no worker threads of its own
+    updater = Updater(bot=bot, workers=0)
+    # Get the dispatcher to register handlers
+    add_handlers(updater.dispatcher)
+
+    # Start the Bot, polling removes the webhook if it was set
     updater.start_polling()
     print("server is started!")
     updater.idle()
-
-
-if __name__ == "__main__":
-    main()
@@ -0,0 +1,53 @@
+"""Posts recorded Telegram updates to the webhook, like Telegram itself does.
+
+Usage: python tgAPI/replay_updates.py updates.json [--url URL] [--delay SECONDS]
+
+'updates.json' holds either a list of updates, a 'getUpdates' response or
+one update per line.
+"""
+import argparse
+import json
+import os
+import time
+
+import requests
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+
+    try:
+        data = json.loads(content)
+    except ValueError:
+        # One update per line
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    if isinstance(data, dict):
+        return data.get("result", [data])
+
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", help="File with recorded updates")
+    parser.add_argument(
+        "--url",
+        default="http://127.0.0.1:8000/tg/%s/" % os.environ.get("TG_WEBHOOK_TOKEN"),
+        help="Webhook URL, including the token",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0, help="Pause between updates in seconds"
+    )
+    args = parser.parse_args()
+
+    session = requests.Session()
+    for update in load_updates(args.path):
+        response = session.post(args.url, json=update, timeout=30)
+        print(update.get("update_id"), response.status_code)
+        time.sleep(args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from tgBot.outbound import ThrottledSender
+
+
+class TgSender(ThrottledSender):
+    """Makes the 'send_*' calls of the bot one by one.
+
+    Calls failed with 429 are retried after the 'retry_after' given by
+    Telegram, network errors after a growing delay.
+    """
+
+    def __init__(self, **kwargs):
+        super(TgSender, self).__init__("tg-sender", **kwargs)
+
+    def send(self, chat_id, method, args=(), kwargs=None):
+        """Queues 'method(*args, **kwargs)', the future gets its result"""
+        return self.submit(chat_id, (method, args, kwargs or {}))
+
+    def _send(self, batch):
+        for message in batch:
+            method, args, kwargs = message.payload
+            try:
+                result = method(*args, **kwargs)
+            except RetryAfter as exc:
+                self._retry(message, exc, delay=exc.retry_after)
+            except BadRequest as exc:
+                self._fail(message, exc)
+            except NetworkError as exc:
+                self._retry(message, exc)
+            except TelegramError as exc:
+                self._fail(message, exc)
+            else:
+                self._succeed(message, result)
@@ -0,0 +1,112 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from telegram.error import BadRequest, RetryAfter
+
+from tgAPI import main, views
+from tgAPI.sender import TgSender
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 7, "type": "private"},
+        "from": {"id": 7, "is_bot": False, "first_name": "First"},
+        "text": "Hello",
+    },
+}
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, key, func, *args, **kwargs):
+        self.submitted.append((key, func))
+
+
+@override_settings(TG_WEBHOOK_TOKEN="secret")
+class TelegramWebhookTests(SimpleTestCase):
+    def setUp(self):
+        views._dispatcher = None
+        self.executor = RecordingExecutor()
+        patcher = mock.patch.object(main, "get_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, token="secret", data=UPDATE):
+        return self.client.post(
+            "/tg/%s/" % token, json.dumps(data), content_type="application/json"
+        )
+
+    def test_update_is_handed_over_to_the_chat_lane(self):
+        response = self.post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.executor.submitted, [(7, main.incoming_commands)])
+
+    def test_dispatcher_is_created_once(self):
+        self.post()
+        dispatcher = views._dispatcher
+        self.post()
+
+        self.assertIs(views._dispatcher, dispatcher)
+        self.assertEqual(len(self.executor.submitted), 2)
+
+    def test_wrong_token_is_forbidden(self):
+        self.assertEqual(self.post(token="wrong").status_code, 403)
+        self.assertEqual(self.executor.submitted, [])
+
+    @override_settings(TG_WEBHOOK_TOKEN=None)
+    def test_webhook_is_off_without_token(self):
+        self.assertEqual(self.post(token="None").status_code, 403)
+
+    def test_only_post_is_allowed(self):
+        self.assertEqual(self.client.get("/tg/secret/").status_code, 405)
+
+    def test_invalid_body_is_rejected(self):
+        response = self.client.post(
+            "/tg/secret/", "{", content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TgSenderTests(SimpleTestCase):
+    def setUp(self):
+        self.sender = TgSender(
+            rate=1000, peer_rate=1000, peer_burst=100, queue_size=100
+        )
+
+    def test_retry_after_is_respected(self):
+        method = mock.Mock(side_effect=[RetryAfter(0), "message"])
+
+        future = self.sender.send(1, method, ("bot",), {"text": "Hello"})
+
+        self.assertEqual(future.result(5), "message")
+        method.assert_called_with("bot", text="Hello")
+        self.assertEqual(method.call_count, 2)
+
+    def test_bad_request_is_not_retried(self):
+        method = mock.Mock(side_effect=BadRequest("Chat not found"))
+
+        with self.assertLogs("tgBot.outbound", "WARNING"):
+            future = self.sender.send(1, method)
+            with self.assertRaises(BadRequest):
+                future.result(5)
+
+        self.assertEqual(method.call_count, 1)
+
+    def test_bot_sends_through_the_sender(self):
+        sender = mock.Mock()
+        bot = main.create_bot(sender=sender)
+
+        result = bot.send_message(chat_id=7, text="Hello")
+
+        self.assertIs(result, sender.send.return_value)
+        chat_id, _, args, kwargs = sender.send.call_args.args
+        self.assertEqual(
+            (chat_id, args, kwargs), (7, (bot,), {"chat_id": 7, "text": "Hello"})
+        )
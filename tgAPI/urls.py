@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import telegram_webhook
+
+urlpatterns = [
+    path('<str:token>/', telegram_webhook, name="tg_webhook"),
+]
@@ -1,18 +1,19 @@
-import os
-import sys
-
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
-sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-import django
-
-django.setup()
+from concurrent.futures import Future
 
 from django.conf import settings
+from django.db import close_old_connections
 
-from questApp.models import Player
+from questApp.models import Player, Step
 from questApp import quest_utils
 from telegram import KeyboardButton, ReplyKeyboardMarkup
+from tgBot import keyboards
+from tgBot.cache import TTLCache
+
+# Telegram file_id of images sent by URL, until it's on the compiled Step or Quest
+_file_ids = TTLCache(
+    timeout=settings.CACHING_TIMEOUTS["TG_FILE_ID"]["TIMEOUT"],
+    maxsize=settings.CACHING_TIMEOUTS["TG_FILE_ID"]["MAXSIZE"],
+)
 
 
 def build_menu(
@@ -29,6 +30,76 @@ def build_menu(
     return menu
 
 
+def render_keyboard(texts, one_time_keyboard=False):
+    """Returns serialized keyboard with a button per row for every text"""
+    button_list = [KeyboardButton(text) for text in texts]
+    reply_markup = ReplyKeyboardMarkup(
+        build_menu(button_list, n_cols=1),
+        resize_keyboard=True,
+        one_time_keyboard=one_time_keyboard,
+    )
+    return reply_markup.to_json()
+
+
+def get_menu_keyboard(menu_id):
+    return keyboards.get_or_render(
+        "TG", (menu_id,), lambda: render_keyboard(keyboards.menu_texts(menu_id))
+    )
+
+
+def get_list_keyboard(texts):
+    texts = tuple(texts)
+    return keyboards.get_or_render(
+        "TG", ("LIST",) + texts, lambda: render_keyboard(keyboards.list_texts(texts))
+    )
+
+
+def get_step_keyboard(step, player_quest):
+    """Returns keyboard of visible options of the 'step', empty one if there are none"""
+
+    def render():
+        texts = keyboards.step_texts(step, player_quest)
+        return render_keyboard(texts, one_time_keyboard=True) if texts else ""
+
+    return keyboards.get_or_render("TG", keyboards.step_key(step, player_quest), render)
+
+
+def save_file_id(model, pk, attr, image, message):
+    """Saves 'file_id' of the 'image' sent by URL to the "tg_" + 'attr' field"""
+    if message and message.photo:
+        file_id = message.photo[-1].file_id
+        _file_ids.set((model._meta.label, pk, attr, image), file_id)
+        # Not saved if the image has been changed in the meantime
+        model.objects.filter(pk=pk, **{attr: image}).update(**{"tg_" + attr: file_id})
+
+
+def send_cached_photo(bot, chat_id, model, pk, attr, image, file_id=None):
+    """Sends image by its Telegram 'file_id', so Telegram doesn't download it again.
+
+    The first time the image is sent by URL and the 'file_id' is saved, the
+    same way 'vk_' fields are filled for VK.
+    """
+    file_id = file_id or _file_ids.get((model._meta.label, pk, attr, image))
+    if file_id:
+        return bot.send_photo(chat_id, photo=file_id)
+
+    result = bot.send_photo(chat_id, photo=image)
+    if isinstance(result, Future):
+        # Done in the thread of the sender, it has no request to close the connection
+        def on_sent(future):
+            if not future.exception():
+                try:
+                    save_file_id(model, pk, attr, image, future.result())
+                finally:
+                    close_old_connections()
+
+        result.add_done_callback(on_sent)
+    else:
+        save_file_id(model, pk, attr, image, result)
+
+    return result
+
+
 def get_or_create_player(bot, update, args=None):
     user = update.effective_user
     referred_by = None
@@ -54,101 +125,53 @@ def get_or_create_player(bot, update, args=None):
     )
 
 
-def _send_step_final(bot, job):
-    bot.send_message(
-        job.context[0].effective_chat.id, job.context[1], reply_markup=job.context[2]
-    )
-
+def send_message(bot, chat_id, text, reply_markup):
+    bot.send_message(chat_id, text, reply_markup=reply_markup)
 
-def _send_step_part(bot, job):
-    bot.send_message(
-        job.context[0].effective_chat.id, job.context[1], reply_markup=job.context[2]
-    )
 
+def send_step_partly(bot, chat_id, scheduler, parts, reply_markup):
+    """Sends the first part of the Step and schedules the rest, step keyboard comes last"""
+    reply_part = get_menu_keyboard("STEP_PART")
+    messages = [(part.delay, part.text, reply_part) for part in parts[1:]]
 
-def send_step_partly(bot, update, job_queue, description, delay_temp, reply_markup):
-    step_parts = description.split("_")
-    step_parts_len = len(step_parts)
-    start = 0
-    reply_part = ReplyKeyboardMarkup(
-        build_menu([quest_utils.menu_text_full("MAIN_MENU")], n_cols=1),
-        resize_keyboard=True,
-    )
+    if messages:
+        delay, text, _ = messages[-1]
+        messages[-1] = (delay, text, reply_markup)
+        bot.send_message(chat_id, parts[0].text, reply_markup=reply_part)
+    else:
+        bot.send_message(chat_id, parts[0].text, reply_markup=reply_markup)
 
-    for i, part_temp in enumerate(step_parts):
-        part = part_temp.split("~")
-        delay = float(part[1]) if len(part) >= 2 else delay_temp
-        if i == 0 and i == step_parts_len - 1:
-            bot.send_message(
-                update.effective_chat.id, part[0], reply_markup=reply_markup
-            )
-        elif i == 0:
-            bot.send_message(update.effective_chat.id, part[0], reply_markup=reply_part)
-        elif i == step_parts_len - 1:
-            start += delay
-            job_queue.run_once(
-                _send_step_final, start, context=(update, part[0], reply_markup)
-            )
-        else:
-            start += delay
-            job_queue.run_once(
-                _send_step_part, start, context=(update, part[0], reply_part)
-            )
+    scheduler.schedule(chat_id, messages)
 
 
-def build_step(bot, update, step, job_queue, player_quest, text="Вы победили!"):
+def build_step(bot, update, step, scheduler, player_quest, text="Вы победили!"):
     if step:
         if step.image:
-            bot.send_photo(update.message.chat_id, photo=step.image)
-
-        options_temp = step.options.all()
-        options = []
-        changes = player_quest.changes.all()
-        for option in options_temp:
-            is_hidden = option.is_hidden
-            if option in changes:
-                is_hidden = not option.is_hidden
-            if not is_hidden:
-                options.append(option)
-
-        if options:
-            button_list = [KeyboardButton(option.text) for option in options]
-            button_list.append(KeyboardButton(quest_utils.menu_text_full("MAIN_MENU")))
-            reply_markup = ReplyKeyboardMarkup(
-                build_menu(button_list, n_cols=1),
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            )
-            send_step_partly(
+            send_cached_photo(
                 bot,
-                update,
-                job_queue,
-                step.description,
-                step.delay,
-                reply_markup=reply_markup,
-            )
-        else:
-            # Step has no options - Lose
-            button_list = [
-                KeyboardButton(quest_utils.menu_text_full("ASK_TO_RESTART")),
-                KeyboardButton(quest_utils.menu_text_full("MAIN_MENU")),
-            ]
-            reply_markup = ReplyKeyboardMarkup(
-                build_menu(button_list, n_cols=1), resize_keyboard=True
-            )
-            bot.send_message(
-                update.effective_chat.id, step.description, reply_markup=reply_markup
+                update.effective_chat.id,
+                Step,
+                step.id,
+                "image",
+                step.image,
+                file_id=step.tg_image,
             )
-    else:
-        button_list = [
-            KeyboardButton(quest_utils.menu_text_full("ASK_TO_RESTART")),
-            KeyboardButton(quest_utils.menu_text_full("MAIN_MENU")),
-        ]
-        reply_markup = ReplyKeyboardMarkup(
-            build_menu(button_list, n_cols=1), resize_keyboard=True
+
+        # Step has no options - Lose
+        reply_markup = get_step_keyboard(step, player_quest) or get_menu_keyboard(
+            "GAME_OVER"
         )
+
+        send_step_partly(
+            bot,
+            update.effective_chat.id,
+            scheduler,
+            step.parts,
+            reply_markup=reply_markup,
+        )
+    else:
         bot.send_message(
             update.effective_chat.id,
             text + "\nНачать заново?",
-            reply_markup=reply_markup,
+            reply_markup=get_menu_keyboard("GAME_OVER"),
         )
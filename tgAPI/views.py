@@ -0,0 +1,45 @@
+import json
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from telegram import Update
+from telegram.ext import Dispatcher
+
+from tgAPI import main
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Returns dispatcher of this process, it's created on the first update"""
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            dispatcher = Dispatcher(main.create_bot(), None, workers=0)
+            main.add_handlers(dispatcher)
+            _dispatcher = dispatcher
+
+    return _dispatcher
+
+
+@csrf_exempt
+def telegram_webhook(request, token):
+    if not settings.TG_WEBHOOK_TOKEN or token != settings.TG_WEBHOOK_TOKEN:
+        return HttpResponse(status=403)
+
+    if request.method != "POST":
+        return HttpResponse(status=405)
+
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+    except ValueError:
+        return HttpResponse(status=400)
+
+    dispatcher = get_dispatcher()
+    dispatcher.process_update(Update.de_json(data, dispatcher.bot))
+
+    return HttpResponse(status=200)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries go stale after 'timeout' seconds.
+
+    :param timeout: Entry lifetime in seconds, 'None' keeps entries until evicted
+    :param maxsize: Maximum number of entries, 'None' means unbounded
+    """
+
+    def __init__(self, timeout=None, maxsize=None):
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so values computed before it are not stored
+        self._generation = 0
+
+    def _is_stale(self, stored_at):
+        return self.timeout is not None and time.monotonic() - stored_at > self.timeout
+
+    def peek(self, key):
+        """Returns '(value, is_stale)' for the given 'key' or 'None' if it's missing"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            self._data.move_to_end(key)
+            value, stored_at = entry
+            return value, self._is_stale(stored_at)
+
+    def get(self, key, default=None):
+        entry = self.peek(key)
+        if entry is None or entry[1]:
+            return default
+
+        return entry[0]
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory):
+        """Returns fresh value of the 'key', calling 'factory()' to build a missing one"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        generation = self._generation
+        value = factory()
+        self.set(key, value, generation=generation)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._generation += 1
+            entry = self._data.pop(key, None)
+
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
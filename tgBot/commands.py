@@ -0,0 +1,50 @@
+from django.conf import settings
+
+from questApp.config_snapshot import config
+
+
+def normalize(text):
+    """Drops repeated and surrounding whitespace, as keyboards may add it"""
+    return " ".join(text.split())
+
+
+class CommandRouter:
+    """Finds the command of a message by the full text of its button.
+
+    Button text is the 'BOT_MENU' emoji followed by the config text of the
+    command, so a router is built for one config version. Message that matches
+    no button goes to the command of its emoji, e.g. the buttons of an old
+    keyboard after the texts were changed. Emoji of several commands only
+    matches by the full text, the commands without config text, like 'GAME',
+    only by the emoji.
+
+    :param table: Command name in 'BOT_MENU' -> method
+    """
+
+    def __init__(self, table):
+        self.version = config.get_version()
+        self.by_text = {}
+        self.by_emoji = {}
+
+        shared_emojis = set()
+        for name, command in table.items():
+            emoji = settings.BOT_MENU[name]
+            text = getattr(config, name, None)
+            if text is not None:
+                self.by_text[normalize(emoji + " " + text)] = command
+
+            if self.by_emoji.get(emoji, command) is not command:
+                shared_emojis.add(emoji)
+            self.by_emoji[emoji] = command
+
+        for emoji in shared_emojis:
+            del self.by_emoji[emoji]
+
+    def get(self, message):
+        """Returns command of the message, 'None' if it's not a command"""
+        text = normalize(message)
+        command = self.by_text.get(text)
+        if command is None and text:
+            command = self.by_emoji.get(text.split(" ", 1)[0])
+
+        return command
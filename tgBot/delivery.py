@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from tgBot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryScheduler:
+    """Sends delayed messages, e.g. the parts of a Step, from a single thread.
+
+    Entries hold only chat id, text and keyboard and are kept in a heap by the
+    time they are due. Every chat has a generation number, scheduling new
+    messages or 'cancel' bumps it, so the messages of the previous generation
+    are dropped instead of being sent after the player has moved on.
+
+    Pending messages and generations live in the memory of the process, so
+    all updates of a chat have to be handled by the process that scheduled
+    its messages: the polling bot or a webhook served by a single process.
+    With several processes an answer handled by another one doesn't cancel
+    the parts of the previous Step.
+
+    The thread never waits for the executor: when the lane of the chat is
+    full, the message is put back for 'retry_delay' seconds along with the
+    later messages of the chat, so other chats are sent meanwhile.
+
+    :param name: Prefix of the thread name and metrics
+    :param send: Called as 'send(chat_id, text, reply_markup)'
+    :param executor: 'KeyedExecutor' to send in the chat's lane, sent inline if 'None'
+    :param retry_delay: Seconds before a message is submitted again to a full lane
+    """
+
+    def __init__(self, name, send, executor=None, retry_delay=0.1):
+        self.name = name
+        self.send = send
+        self.executor = executor
+        self.retry_delay = retry_delay
+        self._heap = []
+        self._sequence = itertools.count()
+        # chat_id -> [generation, messages not sent yet, time the chat is retried at]
+        self._chats = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, chat_id, messages):
+        """Replaces pending messages of the chat.
+
+        :param messages: '(delay, text, reply_markup)' items, 'delay' is counted
+            from the previous message
+        """
+        due = time.monotonic()
+
+        with self._condition:
+            chat = self._cancel(chat_id)
+            for delay, text, reply_markup in messages:
+                due += delay
+                heapq.heappush(
+                    self._heap,
+                    (due, next(self._sequence), chat_id, chat[0], text, reply_markup),
+                )
+                chat[1] += 1
+
+            if not chat[1]:
+                del self._chats[chat_id]
+
+            self._start()
+            self._condition.notify()
+
+        metrics.gauge(self.name + ".queued", len(self._heap))
+
+    def cancel(self, chat_id):
+        """Drops pending messages of the chat"""
+        with self._condition:
+            if chat_id in self._chats:
+                self._cancel(chat_id)
+
+    def _cancel(self, chat_id):
+        chat = self._chats.setdefault(chat_id, [0, 0, 0])
+        chat[0] += 1
+        return chat
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name=self.name, daemon=True
+            )
+            self._thread.start()
+
+    def _is_current(self, chat_id, generation):
+        return self._chats[chat_id][0] == generation
+
+    def _done(self, chat_id):
+        chat = self._chats[chat_id]
+        chat[1] -= 1
+        if not chat[1]:
+            del self._chats[chat_id]
+
+    def _next(self):
+        """Waits for the next due message of the current generation"""
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                entry = heapq.heappop(self._heap)
+                due, _, chat_id, generation = entry[:4]
+                if not self._is_current(chat_id, generation):
+                    self._done(chat_id)
+                    metrics.increment(self.name + ".cancelled")
+                    continue
+
+                retry_at = self._chats[chat_id][2]
+                if due < retry_at:
+                    # An earlier message of the chat waits for its lane, the
+                    # sequence number keeps this one behind it
+                    heapq.heappush(self._heap, (retry_at,) + entry[1:])
+                    continue
+
+                return entry
+
+    def _requeue(self, entry):
+        retry_at = time.monotonic() + self.retry_delay
+
+        with self._condition:
+            self._chats[entry[2]][2] = retry_at
+            heapq.heappush(self._heap, (retry_at,) + entry[1:])
+
+        metrics.increment(self.name + ".requeued")
+
+    def _loop(self):
+        while True:
+            entry = self._next()
+            due, _, chat_id, generation, text, reply_markup = entry
+            metrics.timing(self.name + ".lag", time.monotonic() - due)
+            metrics.gauge(self.name + ".queued", len(self._heap))
+
+            if not self.executor:
+                self._deliver(chat_id, generation, text, reply_markup)
+            elif not self.executor.try_submit(
+                chat_id, self._deliver, chat_id, generation, text, reply_markup
+            ):
+                self._requeue(entry)
+
+    def _deliver(self, chat_id, generation, text, reply_markup):
+        with self._condition:
+            # The chat may be cancelled while the message waited in the lane
+            is_current = self._is_current(chat_id, generation)
+            self._done(chat_id)
+
+        if not is_current:
+            metrics.increment(self.name + ".cancelled")
+            return
+
+        try:
+            self.send(chat_id, text, reply_markup)
+            metrics.increment(self.name + ".sent")
+        except Exception:
+            metrics.increment(self.name + ".failed")
+            logger.exception("Delivery of %s to %s failed", self.name, chat_id)
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+from tgBot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedExecutor:
+    """Pool of worker threads that keeps the order of tasks with the same key.
+
+    Every key is hashed to one lane, a lane is a bounded queue served by a
+    single thread. So messages of one chat are handled one after another,
+    while different chats are handled concurrently. 'submit' blocks when the
+    lane is full, so the producer slows down instead of eating the memory.
+
+    :param name: Prefix of the thread names and metrics
+    :param workers: Number of lanes
+    :param queue_size: Maximum number of waiting tasks per lane
+    """
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+
+            for index, lane in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(lane,),
+                    name="%s-%s" % (self.name, index),
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key, func, *args, **kwargs):
+        """Queues 'func(*args, **kwargs)' behind the other tasks of the 'key'"""
+        lane = self._queues[hash(key) % len(self._queues)]
+        task = (func, args, kwargs, time.monotonic())
+
+        try:
+            lane.put_nowait(task)
+        except queue.Full:
+            metrics.increment(self.name + ".backpressure")
+            started_at = time.monotonic()
+            lane.put(task)
+            metrics.timing(self.name + ".blocked", time.monotonic() - started_at)
+
+        metrics.increment(self.name + ".submitted")
+        metrics.gauge(self.name + ".queued", self.queued())
+
+    def try_submit(self, key, func, *args, **kwargs) -> bool:
+        """Queues the task like 'submit', but drops it instead of waiting if the lane is full
+
+        :returns: 'False' if the task was dropped
+        """
+        lane = self._queues[hash(key) % len(self._queues)]
+
+        try:
+            lane.put_nowait((func, args, kwargs, time.monotonic()))
+        except queue.Full:
+            metrics.increment(self.name + ".dropped")
+            return False
+
+        metrics.increment(self.name + ".submitted")
+        metrics.gauge(self.name + ".queued", self.queued())
+        return True
+
+    def queued(self):
+        """Returns the number of tasks waiting in all lanes"""
+        return sum(lane.qsize() for lane in self._queues)
+
+    def _worker(self, lane):
+        while True:
+            func, args, kwargs, queued_at = lane.get()
+            metrics.timing(self.name + ".wait", time.monotonic() - queued_at)
+
+            # Workers live long, so connections are checked the same way
+            # Django does it around every request
+            close_old_connections()
+            started_at = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                metrics.increment(self.name + ".failed")
+                logger.exception("Task of %s failed", self.name)
+            finally:
+                close_old_connections()
+                metrics.timing(self.name + ".run", time.monotonic() - started_at)
+                lane.task_done()
+
+    def join(self):
+        """Waits until every queued task is done"""
+        for lane in self._queues:
+            lane.join()
@@ -0,0 +1,62 @@
+from django.conf import settings
+
+from questApp import quest_utils
+from questApp.config_snapshot import config
+from tgBot.cache import TTLCache
+
+# Static menus, every button is a 'BOT_MENU' command
+MENUS = {
+    "MAIN": ("MY_GAMES", "ALL_GAMES", "SETTINGS"),
+    "MAIN_WO_GAMES": ("ALL_GAMES", "SETTINGS"),
+    "ASK_TO_START": ("START_GAME", "ALL_GAMES", "MAIN_MENU"),
+    "ASK_TO_RESTART": ("CONFIRM_TO_RESTART", "RETURN_TO_GAME"),
+    "SETTINGS": ("ADD_CONTACT", "MAIN_MENU"),
+    "SETTINGS_PLAYING": (
+        "ASK_TO_RESTART",
+        "RETURN_TO_GAME",
+        "ADD_CONTACT",
+        "MAIN_MENU",
+    ),
+    "CANCEL_CONTACT": ("CANCEL_CONTACT",),
+    "QUEST_ENDED": ("MAIN_MENU", "ASK_TO_RESTART"),
+    "GAME_OVER": ("ASK_TO_RESTART", "MAIN_MENU"),
+    "STEP_PART": ("MAIN_MENU",),
+    "REFERRAL": ("START_WO_REFERRER",),
+}
+
+_keyboards = TTLCache(
+    timeout=settings.CACHING_TIMEOUTS["KEYBOARD"]["TIMEOUT"],
+    maxsize=settings.CACHING_TIMEOUTS["KEYBOARD"]["MAXSIZE"],
+)
+
+
+def get_or_render(platform, key, render):
+    """Returns serialized keyboard, 'render()' is called only if it's not cached yet
+
+    :param platform: Platform the keyboard is rendered for
+    :param key: Tuple that identifies the keyboard along with the config version
+    :param render: Callable that returns serialized keyboard
+    """
+    return _keyboards.get_or_set((platform, config.get_version()) + key, render)
+
+
+def menu_texts(menu_id):
+    return [quest_utils.menu_text_full(name) for name in MENUS[menu_id]]
+
+
+def list_texts(texts):
+    """Texts of a dynamic list of buttons followed by the main menu one"""
+    return [*texts, quest_utils.menu_text_full("MAIN_MENU")]
+
+
+def step_texts(step, player_quest):
+    """Texts of the visible options of 'step' followed by the main menu one"""
+    options = [
+        option.text for option in step.options if player_quest.is_option_visible(option)
+    ]
+    return list_texts(options) if options else []
+
+
+def step_key(step, player_quest):
+    # Visibility of the options depends only on the bits of the step's own options
+    return "STEP", step.id, step.revision, player_quest.toggles & step.options_mask
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Thread-safe counters, gauges and timings of a bot process.
+
+    Values are kept in memory and may be periodically written to the log.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        # name -> [count, total, max]
+        self._timings = {}
+        self._reporter = None
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def snapshot(self):
+        """Returns current values as a plain dict"""
+        with self._lock:
+            values = dict(self._counters)
+            values.update(self._gauges)
+            for name, (count, total, maximum) in self._timings.items():
+                values[name + ".count"] = count
+                values[name + ".avg"] = total / count if count else 0.0
+                values[name + ".max"] = maximum
+
+        return values
+
+    def start_reporting(self, interval):
+        """Logs the snapshot every 'interval' seconds from a daemon thread"""
+        with self._lock:
+            if self._reporter is not None:
+                return
+
+            self._reporter = threading.Thread(
+                target=self._report_loop, args=(interval,), name="metrics", daemon=True
+            )
+            self._reporter.start()
+
+    def _report_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            values = self.snapshot()
+            if values:
+                logger.info(
+                    "Metrics: %s",
+                    ", ".join("%s=%s" % item for item in sorted(values.items())),
+                )
+
+
+metrics = Metrics()
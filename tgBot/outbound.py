@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, NamedTuple
+
+from tgBot.metrics import metrics
+from tgBot.ratelimit import KeyedTokenBuckets, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundMessage(NamedTuple):
+    peer_id: Any
+    payload: Any
+    future: Future
+    queued_at: float
+    attempts: int = 0
+
+
+class ThrottledSender:
+    """Base of the outgoing message queues of the bots.
+
+    Messages wait in a bounded queue and are sent from a single thread, throttled
+    by a global and a per-peer token bucket. Messages of one peer keep their
+    order, also when one of them is retried. Subclasses send the batches
+    collected by '_collect' in '_send' and finish every message with
+    '_succeed', '_retry' or '_fail'.
+
+    :param name: Prefix of the thread name and metrics
+    :param rate: Messages per second for the whole bot
+    :param peer_rate: Messages per second for one peer
+    :param peer_burst: Messages one peer may get at once
+    :param queue_size: Maximum number of messages waiting to be sent
+    :param batch_size: Maximum number of messages passed to '_send' at once
+    :param max_attempts: Attempts to send a message before it's failed
+    :param retry_delay: Seconds before the first retry, doubled for the next ones
+    """
+
+    def __init__(
+        self,
+        name,
+        rate,
+        peer_rate,
+        peer_burst,
+        queue_size,
+        batch_size=1,
+        max_attempts=3,
+        retry_delay=1,
+    ):
+        self.name = name
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._bucket = TokenBucket(rate)
+        self._peer_buckets = KeyedTokenBuckets(peer_rate, peer_burst)
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Used by the sender thread only:
+        # peer_id -> messages waiting for the peer's turn
+        self._held = {}
+        # peer_id -> time the first held message may be sent
+        self._ready_at = {}
+        # (ready_at, sequence, peer_id) of the held peers, outdated ones are skipped
+        self._ready = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, peer_id, payload) -> Future:
+        """Queues the message, the future gets the result of sending it"""
+        future = Future()
+        message = OutboundMessage(peer_id, payload, future, time.monotonic())
+
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            metrics.increment(self.name + ".backpressure")
+            self._queue.put(message)
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+        return future
+
+    def _reserve(self, peer_id, now):
+        """Takes tokens for a message, returns seconds to wait if there are none"""
+        peer_bucket = self._peer_buckets.get(peer_id)
+        delay = max(self._bucket.delay(now), peer_bucket.delay(now))
+        if not delay:
+            self._bucket.take(now)
+            peer_bucket.take(now)
+
+        return delay
+
+    def _schedule(self, peer_id, ready_at):
+        self._ready_at[peer_id] = ready_at
+        heapq.heappush(self._ready, (ready_at, next(self._sequence), peer_id))
+
+    def _hold(self, message, delay, first=False):
+        messages = self._held.setdefault(message.peer_id, deque())
+        if first:
+            messages.appendleft(message)
+        else:
+            messages.append(message)
+
+        if first or message.peer_id not in self._ready_at:
+            self._schedule(message.peer_id, time.monotonic() + delay)
+
+    def _collect(self):
+        """Returns the next messages allowed to be sent, waits for at least one"""
+        batch = []
+
+        while not batch:
+            now = time.monotonic()
+
+            while self._ready and self._ready[0][0] <= now:
+                ready_at, _, peer_id = heapq.heappop(self._ready)
+                if self._ready_at.get(peer_id) != ready_at:
+                    # Rescheduled, e.g. by a retry
+                    continue
+
+                delay = self._reserve(peer_id, now)
+                if delay:
+                    self._schedule(peer_id, now + delay)
+                    continue
+
+                messages = self._held[peer_id]
+                batch.append(messages.popleft())
+                if messages:
+                    self._schedule(peer_id, now)
+                else:
+                    del self._held[peer_id]
+                    del self._ready_at[peer_id]
+
+                if len(batch) == self.batch_size:
+                    return batch
+
+            if batch:
+                timeout = 0
+            elif self._ready:
+                timeout = max(0.0, self._ready[0][0] - now)
+            else:
+                timeout = None
+
+            while len(batch) < self.batch_size:
+                try:
+                    if batch or timeout == 0:
+                        message = self._queue.get_nowait()
+                    else:
+                        message = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                now = time.monotonic()
+                if message.peer_id in self._held:
+                    # Goes after the held messages of the same peer
+                    self._hold(message, 0)
+                    continue
+
+                delay = self._reserve(message.peer_id, now)
+                if delay:
+                    self._hold(message, delay)
+                    # Not to wait for the next message longer than for this one
+                    if timeout is None or timeout > delay:
+                        timeout = delay
+                else:
+                    batch.append(message)
+
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            metrics.gauge(
+                self.name + ".queued",
+                self._queue.qsize() + sum(len(held) for held in self._held.values()),
+            )
+
+            try:
+                self._send(batch)
+            except Exception as exc:
+                logger.exception("Messages of %s were not sent", self.name)
+                for message in batch:
+                    if not message.future.done():
+                        self._fail(message, exc)
+
+    def _send(self, batch):
+        raise NotImplementedError
+
+    def _succeed(self, message, result):
+        metrics.increment(self.name + ".sent")
+        metrics.timing(self.name + ".wait", time.monotonic() - message.queued_at)
+        message.future.set_result(result)
+
+    def _retry(self, message, exc, delay=None):
+        """Sends the message again before the other messages of the peer"""
+        attempts = message.attempts + 1
+        if attempts >= self.max_attempts:
+            self._fail(message, exc)
+            return
+
+        if delay is None:
+            delay = self.retry_delay * 2 ** (attempts - 1)
+
+        metrics.increment(self.name + ".retried")
+        self._hold(message._replace(attempts=attempts), delay, first=True)
+
+    def _fail(self, message, exc):
+        metrics.increment(self.name + ".failed")
+        logger.warning("Message of %s to %s failed: %s", self.name, message.peer_id, exc)
+        message.future.set_exception(exc)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from tgBot.cache import TTLCache
+
+
+class TokenBucket:
+    """Allows 'rate' actions per second with bursts of up to 'capacity' actions.
+
+    :param rate: Tokens added per second
+    :param capacity: Maximum number of tokens, 'rate' but at least one if 'None'
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # 'now' may be read before the bucket was created
+        if now > self._updated_at:
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+
+    def delay(self, now=None):
+        """Returns seconds until a token is available, '0' if it's available now"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self, now=None):
+        """Takes a token, the balance goes negative if there was none"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._refill(now)
+            self._tokens -= 1
+
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+        while True:
+            delay = self.delay()
+            if not delay:
+                self.take()
+                return
+
+            time.sleep(delay)
+
+
+class KeyedTokenBuckets:
+    """Separate 'TokenBucket' for every key, e.g. for every chat.
+
+    Idle buckets are evicted, a new bucket is full, so it's the same as the
+    evicted one after it refilled.
+
+    :param rate: Tokens added per second to each bucket
+    :param capacity: Maximum number of tokens in each bucket
+    :param maxsize: Maximum number of buckets kept
+    """
+
+    def __init__(self, rate, capacity=None, maxsize=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = TTLCache(maxsize=maxsize)
+
+    def get(self, key) -> TokenBucket:
+        return self._buckets.get_or_set(key, lambda: TokenBucket(self.rate, self.capacity))
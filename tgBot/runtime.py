@@ -0,0 +1,76 @@
+"""Entry point of the bots.
+
+Usage: python -m tgBot.runtime tg [--webhook]
+       python -m tgBot.runtime vk
+
+Django is set up once before anything else is imported, and only the
+modules and the SDK of the chosen platform are loaded.
+"""
+import argparse
+import importlib
+import logging
+import os
+import threading
+
+_lock = threading.Lock()
+
+# Module with 'main()' of every platform
+PLATFORMS = {"tg": "tgAPI.main", "vk": "vkAPI.main"}
+
+
+def setup():
+    """Sets Django up unless it's done already, e.g. by 'manage.py' or WSGI"""
+    with _lock:
+        import django
+        from django.apps import apps
+
+        if apps.ready:
+            return
+
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
+        django.setup()
+
+
+def count_processes():
+    """Returns number of the uWSGI workers of the site, 1 for other servers"""
+    try:
+        import uwsgi
+    except ImportError:
+        return 1
+
+    return uwsgi.numproc
+
+
+def load(platform):
+    """Returns module of the platform, the SDK is imported along with it"""
+    setup()
+    return importlib.import_module(PLATFORMS[platform])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the quest bot")
+    parser.add_argument("platform", choices=sorted(PLATFORMS))
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Sets the Telegram webhook instead of running the bot",
+    )
+    args = parser.parse_args(argv)
+
+    if args.webhook and args.platform != "tg":
+        parser.error("--webhook is supported by Telegram only")
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+    module = load(args.platform)
+    if args.webhook:
+        module.set_webhook()
+    else:
+        module.main()
+
+
+if __name__ == "__main__":
+    main()
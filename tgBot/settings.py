@@ -188,6 +188,17 @@ else:
 
 TG_JOIN_URL = "https://teleg.run/"
 
+# Telegram webhook, updates are posted to TG_WEBHOOK_URL + TG_WEBHOOK_TOKEN + "/".
+# Telegram accepts HTTPS only, so there is no default: e.g. "https://example.com/tg/"
+# Serve it by a single process (threads are fine): delayed Step parts are kept
+# and cancelled in the memory of the process, see 'tgBot.delivery'
+TG_WEBHOOK_URL = os.environ.get("TG_WEBHOOK_URL")
+TG_WEBHOOK_TOKEN = os.environ.get("TG_WEBHOOK_TOKEN")
+# Telegram Bot API server, 'None' means the official one
+TG_BASE_URL = os.environ.get("TG_BASE_URL")
+# Chat the "prewarm_tg_images" command sends images to
+TG_PREWARM_CHAT_ID = os.environ.get("TG_PREWARM_CHAT_ID")
+
 CONSTANCE_BACKEND = "constance.backends.database.DatabaseBackend"
 
 CONSTANCE_CONFIG = {
@@ -211,6 +222,7 @@ CONSTANCE_CONFIG = {
     "GAME_START_BUTTON": ("Чтобы начать игру нажмите", " "),
     "BUY_LINK_TEXT": ("Ссылка для покупки квеста: \n", " "),
     "BUY_ERROR": ("Что-то пошло не так.", " "),
+    "QUEST_UNLOCKED": ("Оплата прошла, теперь вам доступен квест", " "),
     "QUEST_IS_NOT_AVAILABLE": ("Квест недоступен", " "),
     "QUEST_IS_ON_AWARDING": ("Этот квест находится в розыгрыше!", " "),
     "QUEST_DESCRIPTION": ("Описание квеста:", " "),
@@ -238,11 +250,79 @@ CACHING_TIMEOUTS = {
     "STEP": {"TIMEOUT": 60 * 5},
     "OPTION": {"TIMEOUT": 60 * 5},
     "QUEST": {"TIMEOUT": 60 * 5},
+    "QUEST_CATALOG": {"TIMEOUT": 60 * 5},
     "PLAYER_QUEST": {"TIMEOUT": 60 * 5},
-    "PLAYER": {"TIMEOUT": 60 * 5},
+    "PLAYER": {"TIMEOUT": 60 * 5, "MAXSIZE": 10000},
+    "VK_PROFILE": {"TIMEOUT": 60 * 60, "MAXSIZE": 10000},
+    "CONFIG": {"TIMEOUT": 10},
+    "KEYBOARD": {"TIMEOUT": None, "MAXSIZE": 10000},
+    "TG_FILE_ID": {"TIMEOUT": None, "MAXSIZE": 1000},
+    "VK_ATTACHMENT": {"TIMEOUT": None, "MAXSIZE": 1000},
 }
 
 
+# Threads handling the updates, messages of one chat always go to the same worker
+WORKER_POOLS = {
+    "VK": {
+        "WORKERS": int(os.environ.get("VK_WORKERS", 8)),
+        "QUEUE_SIZE": int(os.environ.get("VK_QUEUE_SIZE", 100)),
+    },
+    "TG": {
+        "WORKERS": int(os.environ.get("TG_WORKERS", 8)),
+        "QUEUE_SIZE": int(os.environ.get("TG_QUEUE_SIZE", 100)),
+    },
+    # Shortening of the payment links, in the lane of the Payment
+    "PAYMENT_LINKS": {"WORKERS": 2, "QUEUE_SIZE": 100},
+}
+
+# Seconds between VK long poll reconnects, doubled after every failure in a row
+VK_RECONNECT = {"BACKOFF": 1, "MAX_BACKOFF": 60}
+
+# Outgoing VK messages: per second for the group, per second and burst for a peer,
+# API_RATE limits all API calls of the process
+VK_SENDER = {
+    "RATE": 18,
+    "PEER_RATE": 1,
+    "PEER_BURST": 5,
+    "QUEUE_SIZE": 1000,
+    "API_RATE": 20,
+}
+
+# Outgoing Telegram messages, the same meaning as for VK_SENDER
+TG_SENDER = {
+    "RATE": 28,
+    "PEER_RATE": 1,
+    "PEER_BURST": 3,
+    "QUEUE_SIZE": 1000,
+    "MAX_ATTEMPTS": 5,
+}
+
+# Payment notifications are sent by the site processes with the tokens of the bots.
+# RATE messages per second of the group and bot limits are kept for them, the bots
+# take the rest. The rate is split between the uWSGI processes of the site
+NOTIFICATION_SENDER = {"RATE": 2}
+
+# Service making short payment links, it's called with 'url', 'access_token' and 'v'
+# like VK's utils.getShortLink. TIMEOUT is seconds to connect and to read the response
+PAYMENT_SHORTENER = {
+    "URL": os.environ.get(
+        "PAYMENT_SHORTENER_URL", "https://api.vk.com/method/utils.getShortLink"
+    ),
+    "TIMEOUT": float(os.environ.get("PAYMENT_SHORTENER_TIMEOUT", 5)),
+}
+
+# Step progress of the players is written in batches every INTERVAL seconds.
+# Buffered steps are seen by their process only, so it needs every update of a player
+# handled by one process: polling or a single webhook process
+PROGRESS_WRITE_BEHIND = {
+    "ENABLED": os.environ.get("PROGRESS_WRITE_BEHIND", "") == "1",
+    "INTERVAL": float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 0.5)),
+}
+
+# Seconds between metrics written to the log
+METRICS_REPORT_INTERVAL = int(os.environ.get("METRICS_REPORT_INTERVAL", 60))
+
+
 BOT_MENU = {
     "MY_GAMES": "🎮",
     "BUY_GAME": "💰",
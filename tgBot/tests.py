@@ -0,0 +1,363 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from player.models import Player
+from questApp import quest_graph, quest_utils
+from questApp.config_snapshot import config
+from questApp.models import Option, PlayersQuest, Quest, Step
+from tgAPI import utils as tg_utils
+from tgAPI.bot import TGBot
+from tgBot import keyboards
+from tgBot.commands import CommandRouter
+from tgBot.delivery import DeliveryScheduler
+from tgBot.outbound import ThrottledSender
+from tgBot.ratelimit import KeyedTokenBuckets, TokenBucket
+
+
+def my_games():
+    pass
+
+
+def all_games():
+    pass
+
+
+def game():
+    pass
+
+
+def ask_to_restart():
+    pass
+
+
+def confirm_to_restart():
+    pass
+
+
+class CommandRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = CommandRouter(
+            {
+                "MY_GAMES": my_games,
+                "ALL_GAMES": all_games,
+                "GAME": game,
+                "ASK_TO_RESTART": ask_to_restart,
+                "CONFIRM_TO_RESTART": confirm_to_restart,
+            }
+        )
+
+    def test_full_text_is_matched(self):
+        self.assertIs(self.router.get(quest_utils.menu_text_full("MY_GAMES")), my_games)
+
+    def test_surrounding_whitespace_is_ignored(self):
+        text = quest_utils.menu_text_full("ALL_GAMES").replace(" ", "  ")
+        self.assertIs(self.router.get(" " + text + "\n"), all_games)
+
+    def test_old_button_text_goes_to_command_of_its_emoji(self):
+        self.assertIs(self.router.get("🎮 Old text"), my_games)
+        self.assertIs(self.router.get("♟️ Quest"), game)
+
+    def test_shared_emoji_is_matched_by_full_text_only(self):
+        self.assertIs(
+            self.router.get(quest_utils.menu_text_full("CONFIRM_TO_RESTART")),
+            confirm_to_restart,
+        )
+        self.assertIsNone(self.router.get("♻️ Old text"))
+
+    def test_unknown_text_is_no_command(self):
+        self.assertIsNone(self.router.get("Hello"))
+        self.assertIsNone(self.router.get("   "))
+
+    def test_router_keeps_config_version(self):
+        self.assertEqual(self.router.version, config.get_version())
+
+
+class JunkMessageTests(TestCase):
+    def setUp(self):
+        quest_graph.invalidate()
+        quest = Quest.objects.create(name="Quest")
+        first_step = Step.objects.create(quest=quest, description="First", is_first=True)
+        second_step = Step.objects.create(quest=quest, description="Second")
+
+        go = Option.objects.create(quest=quest, text="Go", next_step=second_step)
+        first_step.options.add(go)
+        back = Option.objects.create(quest=quest, text="Back", next_step=first_step)
+        second_step.options.add(back)
+
+        player = Player.objects.create(user_id="1", player_type="TG")
+        player_quest = PlayersQuest.objects.create(
+            quest=quest, player=player, current_step=first_step
+        )
+        Player.objects.filter(pk=player.pk).update(active_quest=player_quest)
+
+        self.ctx = SimpleNamespace(player=quest_utils.load_player(pk=player.pk))
+        # Compiled before the checks, as the first message of a quest does it
+        quest_graph.get_quest(quest.pk)
+
+    def get_command(self, message):
+        return TGBot.get_command(message, self.ctx)
+
+    def test_option_of_current_step_goes_to_game(self):
+        with self.assertNumQueries(0):
+            command = self.get_command("Go")
+
+        self.assertIs(command.func, TGBot.handle_game_option)
+
+    def test_junk_is_dropped_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get_command("Hello"))
+
+    def test_option_of_another_step_is_dropped(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get_command("Back"))
+
+    def test_message_without_active_quest_is_dropped(self):
+        self.ctx.player.active_quest = None
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get_command("Go"))
+
+    def test_contact_goes_to_game(self):
+        self.ctx.player.is_next_message_contact = True
+
+        self.assertIs(self.get_command("+70000000000").func, TGBot.handle_game_option)
+
+
+class FullLaneExecutor:
+    """Refuses the first tasks of 'full_chat' the way a full lane does"""
+
+    def __init__(self, full_chat, refusals):
+        self.full_chat = full_chat
+        self.refusals = refusals
+
+    def try_submit(self, key, func, *args):
+        if key == self.full_chat and self.refusals:
+            self.refusals -= 1
+            return False
+
+        func(*args)
+        return True
+
+
+class DeliverySchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.condition = threading.Condition()
+
+    def send(self, chat_id, text, reply_markup):
+        with self.condition:
+            self.sent.append((chat_id, text))
+            self.condition.notify_all()
+
+    def wait_sent(self, count):
+        with self.condition:
+            self.assertTrue(
+                self.condition.wait_for(lambda: len(self.sent) >= count, timeout=5)
+            )
+        # Nothing else is sent afterwards
+        time.sleep(0.2)
+        return self.sent
+
+    def create(self, executor=None):
+        return DeliveryScheduler("test-delivery", self.send, executor, retry_delay=0.05)
+
+    def test_messages_are_sent_in_order_after_their_delays(self):
+        scheduler = self.create()
+        started_at = time.monotonic()
+
+        scheduler.schedule(1, [(0, "one", None), (0.1, "two", None), (0.1, "three", None)])
+
+        self.assertEqual(self.wait_sent(3), [(1, "one"), (1, "two"), (1, "three")])
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.2)
+
+    def test_cancel_drops_messages_of_the_chat_only(self):
+        scheduler = self.create()
+        scheduler.schedule(1, [(0.2, "late", None)])
+        scheduler.schedule(2, [(0.2, "other chat", None)])
+
+        scheduler.cancel(1)
+
+        self.assertEqual(self.wait_sent(1), [(2, "other chat")])
+        self.assertEqual(scheduler._chats, {})
+
+    def test_new_messages_replace_pending_ones(self):
+        scheduler = self.create()
+        scheduler.schedule(1, [(0.2, "previous step", None)])
+
+        scheduler.schedule(1, [(0, "next step", None)])
+
+        self.assertEqual(self.wait_sent(1), [(1, "next step")])
+
+    def test_full_lane_holds_up_its_chat_only(self):
+        scheduler = self.create(FullLaneExecutor(full_chat=1, refusals=3))
+
+        scheduler.schedule(1, [(0, "one", None), (0, "two", None)])
+        scheduler.schedule(2, [(0, "other chat", None)])
+
+        self.assertEqual(
+            self.wait_sent(3), [(2, "other chat"), (1, "one"), (1, "two")]
+        )
+
+
+class KeyboardsTests(TestCase):
+    def setUp(self):
+        keyboards._keyboards.clear()
+        quest_graph.invalidate()
+        quest = Quest.objects.create(name="Quest")
+        step = Step.objects.create(quest=quest, description="Step", is_first=True)
+        self.shown = Option.objects.create(quest=quest, text="Shown")
+        self.hidden = Option.objects.create(quest=quest, text="Hidden", is_hidden=True)
+        # Not an option of the step, but toggled by the player
+        self.elsewhere = Option.objects.create(quest=quest, text="Elsewhere")
+        step.options.add(self.shown, self.hidden)
+
+        self.step = quest_graph.get_step(quest.pk, step.pk)
+        self.player_quest = PlayersQuest(quest=quest)
+
+    def test_keyboard_is_rendered_once(self):
+        render = mock.Mock(return_value="keyboard")
+
+        self.assertEqual(keyboards.get_or_render("TG", ("MAIN",), render), "keyboard")
+        self.assertEqual(keyboards.get_or_render("TG", ("MAIN",), render), "keyboard")
+        self.assertEqual(keyboards.get_or_render("VK", ("MAIN",), render), "keyboard")
+
+        self.assertEqual(render.call_count, 2)
+
+    def test_keyboard_is_rendered_again_for_new_config(self):
+        render = mock.Mock(return_value="keyboard")
+        keyboards.get_or_render("TG", ("MAIN",), render)
+
+        with mock.patch.object(keyboards.config, "get_version", return_value=-1):
+            keyboards.get_or_render("TG", ("MAIN",), render)
+
+        self.assertEqual(render.call_count, 2)
+
+    def test_menu_has_a_button_per_command(self):
+        keyboard = json.loads(tg_utils.get_menu_keyboard("MAIN"))
+
+        self.assertEqual(
+            [row[0]["text"] for row in keyboard["keyboard"]],
+            keyboards.menu_texts("MAIN"),
+        )
+
+    def test_step_keyboard_shows_visible_options(self):
+        self.assertEqual(
+            keyboards.step_texts(self.step, self.player_quest),
+            ["Shown", quest_utils.menu_text_full("MAIN_MENU")],
+        )
+
+        self.player_quest.toggles = 1 << self.shown.bit | 1 << self.hidden.bit
+        self.assertEqual(
+            keyboards.step_texts(self.step, self.player_quest),
+            ["Hidden", quest_utils.menu_text_full("MAIN_MENU")],
+        )
+
+        self.player_quest.toggles = 1 << self.shown.bit
+        self.assertEqual(keyboards.step_texts(self.step, self.player_quest), [])
+        self.assertEqual(tg_utils.get_step_keyboard(self.step, self.player_quest), "")
+
+    def test_options_of_other_steps_share_the_step_keyboard(self):
+        key = keyboards.step_key(self.step, self.player_quest)
+
+        self.player_quest.toggles = 1 << self.elsewhere.bit
+
+        self.assertEqual(keyboards.step_key(self.step, self.player_quest), key)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_is_allowed_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        for _ in range(3):
+            self.assertEqual(bucket.delay(now=bucket._updated_at), 0)
+            bucket.take(now=bucket._updated_at)
+
+        now = bucket._updated_at
+        self.assertEqual(bucket.delay(now=now), 0.5)
+        self.assertEqual(bucket.delay(now=now + 0.5), 0)
+
+    def test_new_bucket_is_full_for_earlier_time(self):
+        now = time.monotonic()
+        bucket = TokenBucket(rate=5, capacity=1)
+
+        self.assertEqual(bucket.delay(now=now), 0)
+
+    def test_rate_below_one_still_allows_a_message(self):
+        bucket = TokenBucket(rate=0.5)
+
+        self.assertEqual(bucket.delay(), 0)
+
+    def test_keys_have_separate_buckets(self):
+        buckets = KeyedTokenBuckets(rate=1, capacity=1)
+        buckets.get(1).take()
+
+        self.assertGreater(buckets.get(1).delay(), 0)
+        self.assertEqual(buckets.get(2).delay(), 0)
+
+
+class RecordingSender(ThrottledSender):
+    """Sends payloads to a list, the ones from 'failures' are retried once"""
+
+    def __init__(self, failures=(), **kwargs):
+        options = dict(rate=1000, peer_rate=1000, peer_burst=100, queue_size=100)
+        options.update(kwargs)
+        super(RecordingSender, self).__init__("test-sender", retry_delay=0.05, **options)
+        self.failures = list(failures)
+        self.sent = []
+
+    def _send(self, batch):
+        for message in batch:
+            if message.payload in self.failures:
+                self.failures.remove(message.payload)
+                self._retry(message, RuntimeError("Try again"))
+            else:
+                self.sent.append(message.payload)
+                self._succeed(message, message.payload)
+
+
+class ThrottledSenderTests(SimpleTestCase):
+    def test_retried_message_keeps_its_place(self):
+        sender = RecordingSender(failures=["first"])
+
+        futures = [sender.submit(1, payload) for payload in ("first", "second", "third")]
+
+        self.assertEqual(
+            [future.result(5) for future in futures], ["first", "second", "third"]
+        )
+        self.assertEqual(sender.sent, ["first", "second", "third"])
+
+    def test_throttled_peer_does_not_hold_up_others(self):
+        sender = RecordingSender(peer_rate=5, peer_burst=1)
+        started_at = time.monotonic()
+
+        futures = [
+            sender.submit(1, "one"),
+            sender.submit(1, "two"),
+            sender.submit(2, "other"),
+        ]
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual(sender.sent, ["one", "other", "two"])
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+
+    def test_last_throttled_message_is_sent_without_new_ones(self):
+        sender = RecordingSender(peer_rate=5, peer_burst=1)
+        sender.submit(1, "one").result(5)
+
+        self.assertEqual(sender.submit(1, "two").result(5), "two")
+
+    def test_message_fails_after_last_attempt(self):
+        sender = RecordingSender(failures=["lost"] * 3, max_attempts=3)
+
+        with self.assertLogs("tgBot.outbound", "WARNING"):
+            future = sender.submit(1, "lost")
+            with self.assertRaises(RuntimeError):
+                future.result(5)
+
+        self.assertEqual(sender.sent, [])
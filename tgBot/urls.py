@@ -19,5 +19,6 @@ from django.urls import path, include
 urlpatterns = [
     path('admin_tools/', include('admin_tools.urls')),
     path('admin/', admin.site.urls),
-    path('webhook/', include('payment.urls'))
+    path('webhook/', include('payment.urls')),
+    path('tg/', include('tgAPI.urls')),
 ]
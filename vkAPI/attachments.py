@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+
+from questApp import quest_graph
+from questApp.models import Quest, Step
+from tgBot.cache import TTLCache
+from tgBot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentUploader:
+    """VK attachments of the quest images.
+
+    Known attachments are returned from the model or from memory. Missing ones
+    are downloaded and uploaded to VK by a background thread. Quest images are
+    prefetched when the quest is chosen, so the handler that needs an image
+    first waits up to 'wait_timeout' seconds for its upload, and the message
+    goes without the image if it takes longer.
+
+    :param timeout: Seconds attachments are kept in memory, forever if 'None'
+    :param maxsize: Maximum number of attachments kept in memory
+    :param download_timeout: Seconds to wait for the image download
+    :param wait_timeout: Seconds a handler waits for the upload of a missing image
+    """
+
+    def __init__(self, timeout, maxsize, download_timeout=30, wait_timeout=2):
+        self.download_timeout = download_timeout
+        self.wait_timeout = wait_timeout
+        self.session = requests.Session()
+        self._attachments = TTLCache(timeout=timeout, maxsize=maxsize)
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        # Notified whenever an upload is over
+        self._uploaded = threading.Condition(self._lock)
+        self._thread = None
+
+    def get(self, upload, model, pk, attr, image, vk_image=None):
+        """Returns attachment of the image, 'None' if it's still being uploaded"""
+        if vk_image:
+            return vk_image
+
+        key = (model._meta.label, pk, attr, image)
+        attachment = self._attachments.get(key)
+        if attachment:
+            return attachment
+
+        self.schedule(upload, model, pk, attr, image)
+        with self._uploaded:
+            self._uploaded.wait_for(
+                lambda: key not in self._queued, timeout=self.wait_timeout
+            )
+
+        attachment = self._attachments.get(key)
+        metrics.increment("vk-attachments." + ("waited" if attachment else "missed"))
+        return attachment
+
+    def schedule(self, upload, model, pk, attr, image):
+        key = (model._meta.label, pk, attr, image)
+
+        with self._lock:
+            if key in self._queued:
+                return
+
+            self._queued.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="vk-attachments", daemon=True
+                )
+                self._thread.start()
+
+        self._queue.put((key, upload, model, pk, attr, image))
+
+    def prefetch_quest(self, upload, quest):
+        """Uploads missing images of the quest and of its Steps"""
+        for attr in ("image_descr", "image_award"):
+            if getattr(quest, attr) and not getattr(quest, "vk_" + attr):
+                self.schedule(upload, Quest, quest.pk, attr, getattr(quest, attr))
+
+        for step in quest_graph.get_quest(quest.pk).steps.values():
+            if step.image and not step.vk_image:
+                self.schedule(upload, Step, step.id, "image", step.image)
+
+    def prefetch_active_quests(self, upload):
+        for quest in Quest.objects.filter(is_active=True):
+            self.prefetch_quest(upload, quest)
+
+    def _loop(self):
+        while True:
+            key, upload, model, pk, attr, image = self._queue.get()
+
+            close_old_connections()
+            try:
+                self._upload(key, upload, model, pk, attr, image)
+                metrics.increment("vk-attachments.uploaded")
+            except Exception as exc:
+                # It's tried again when the image is needed next time
+                metrics.increment("vk-attachments.failed")
+                logger.warning("Upload of %s to VK failed: %s", image, exc)
+            finally:
+                close_old_connections()
+                with self._uploaded:
+                    self._queued.discard(key)
+                    self._uploaded.notify_all()
+
+    def _upload(self, key, upload, model, pk, attr, image):
+        if self._attachments.get(key):
+            return
+
+        photo_raw = self.session.get(image, stream=True, timeout=self.download_timeout).raw
+        photo = upload.photo_messages(photos=photo_raw)[0]
+        attachment = "photo{}_{}".format(photo["owner_id"], photo["id"])
+
+        self._attachments.set(key, attachment)
+        # Not saved if the image has been changed in the meantime
+        model.objects.filter(pk=pk, **{attr: image}).update(**{"vk_" + attr: attachment})
+
+
+attachments = AttachmentUploader(
+    timeout=settings.CACHING_TIMEOUTS["VK_ATTACHMENT"]["TIMEOUT"],
+    maxsize=settings.CACHING_TIMEOUTS["VK_ATTACHMENT"]["MAXSIZE"],
+)
@@ -1,28 +1,28 @@
-import os
-import sys
-import django
+import logging
+import time
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
-sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-django.setup()
-
-import vk_api
-import sys
-
-from telegram.ext import JobQueue
+from functools import partial
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
 from vk_api.upload import VkUpload
 from vkAPI import utils
+from vkAPI.attachments import attachments
+from vkAPI.sender import QueuedVkApi
 from django.conf import settings
 
-from tgBot.bots import VKBot
+from vkAPI.bot import VKBot
+from tgBot.delivery import DeliveryScheduler
+from tgBot.executor import KeyedExecutor
+from tgBot.metrics import metrics
 
+logger = logging.getLogger(__name__)
 
-def handle_message(bot, update, upload, job_queue):
+
+def handle_message(bot, update, upload, scheduler):
     message = update.obj.text
+    # Parts of the previous Step are not sent once the player has answered
+    scheduler.cancel(update.obj.from_id)
     bot_ctx = VKBot(
-        message=message, bot=bot, update=update, upload=upload, job_queue=job_queue
+        message=message, bot=bot, update=update, upload=upload, scheduler=scheduler
     )
 
     # Get command and run
@@ -31,28 +31,70 @@ def handle_message(bot, update, upload, job_queue):
         command()
 
 
+def create_executor():
+    return KeyedExecutor(
+        "vk",
+        workers=settings.WORKER_POOLS["VK"]["WORKERS"],
+        queue_size=settings.WORKER_POOLS["VK"]["QUEUE_SIZE"],
+    )
+
+
+def dispatch(event, vk, upload, scheduler, executor):
+    # Events of one user are handled in order, different users concurrently
+    if event.type == VkBotEventType.MESSAGE_NEW:
+        executor.submit(event.obj.from_id, handle_message, vk, event, upload, scheduler)
+    elif event.type == VkBotEventType.GROUP_JOIN:
+        executor.submit(event.obj.user_id, utils.send_referral_input, vk, event)
+    elif event.type == VkBotEventType.GROUP_LEAVE:
+        pass
+
+
+def get_backoff(failures):
+    """Seconds to wait before the reconnect after 'failures' errors in a row"""
+    return min(
+        settings.VK_RECONNECT["BACKOFF"] * 2 ** (failures - 1),
+        settings.VK_RECONNECT["MAX_BACKOFF"],
+    )
+
+
 def main():
-    try:
-        vk_session = vk_api.VkApi(token=settings.VK_ACCESS_TOKEN)
-        vk = vk_session.get_api()
-        job_queue = JobQueue(vk)
-        job_queue.start()
-        upload = VkUpload(vk_session)
-
-        long_poll = VkBotLongPoll(vk_session, settings.VK_GROUP_ID)
-
-        for event in long_poll.listen():
-            if event.type == VkBotEventType.MESSAGE_NEW:
-                handle_message(vk, event, upload, job_queue)
-            elif event.type == VkBotEventType.GROUP_JOIN:
-                utils.send_referral_input(vk, event)
-            elif event.type == VkBotEventType.GROUP_LEAVE:
-                pass
-
-    except Exception as exc:
-        print(exc, file=sys.stderr)
-        main()
-
-
-if __name__ == "__main__":
-    main()
+    vk_session = QueuedVkApi(token=settings.VK_ACCESS_TOKEN)
+    vk = vk_session.get_api()
+    upload = VkUpload(vk_session)
+    attachments.prefetch_active_quests(upload)
+
+    executor = create_executor()
+    executor.start()
+    scheduler = DeliveryScheduler(
+        "vk-delivery", send=partial(utils.send_message, vk), executor=executor
+    )
+    metrics.start_reporting(settings.METRICS_REPORT_INTERVAL)
+
+    long_poll = None
+    failures = 0
+    while True:
+        try:
+            if long_poll is None:
+                long_poll = VkBotLongPoll(vk_session, settings.VK_GROUP_ID)
+            elif failures:
+                # The key may be expired, 'ts' is kept to continue where it stopped
+                long_poll.update_longpoll_server(update_ts=False)
+
+            while True:
+                events = long_poll.check()
+                failures = 0
+                for event in events:
+                    dispatch(event, vk, upload, scheduler, executor)
+
+        except Exception as exc:
+            failures += 1
+            delay = get_backoff(failures)
+            metrics.increment("vk.reconnects")
+            metrics.gauge("vk.failures_in_row", failures)
+            logger.warning(
+                "VK long poll failed (%s in a row), reconnecting in %ss: %s",
+                failures,
+                delay,
+                exc,
+            )
+            time.sleep(delay)
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from tgBot.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Maximum amount of 'user_ids' accepted by one 'users.get' call
+USERS_GET_BATCH_SIZE = 1000
+
+
+class ProfileCache:
+    """Cache of VK 'users.get' results.
+
+    Unknown users are fetched inline. Stale profiles are returned as is and
+    refreshed in batches by a background thread.
+
+    :param timeout: Seconds after which a profile is refreshed
+    :param maxsize: Maximum number of cached profiles
+    :param refresh_delay: Seconds to collect stale ids before a batch is requested
+    """
+
+    def __init__(self, timeout, maxsize, refresh_delay=1):
+        self.refresh_delay = refresh_delay
+        self._profiles = TTLCache(timeout=timeout, maxsize=maxsize)
+        self._stale_ids = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._vk = None
+
+    def get(self, vk, user_id):
+        user_id = str(user_id)
+        entry = self._profiles.peek(user_id)
+
+        if entry is None:
+            profile = vk.users.get(user_ids=user_id)[0]
+            self._profiles.set(user_id, profile)
+            return profile
+
+        profile, is_stale = entry
+        if is_stale:
+            self._schedule_refresh(vk, user_id)
+
+        return profile
+
+    def _schedule_refresh(self, vk, user_id):
+        with self._lock:
+            self._vk = vk
+            self._stale_ids.add(user_id)
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refresh_loop, name="vk-profile-refresh", daemon=True
+                )
+                self._thread.start()
+
+        self._wakeup.set()
+
+    def _refresh_loop(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.refresh_delay)
+
+            with self._lock:
+                self._wakeup.clear()
+                user_ids = list(self._stale_ids)[:USERS_GET_BATCH_SIZE]
+                self._stale_ids.difference_update(user_ids)
+                if self._stale_ids:
+                    self._wakeup.set()
+                vk = self._vk
+
+            try:
+                self.refresh(vk, user_ids)
+            except Exception as exc:
+                # Stale profiles are scheduled again on the next access
+                logger.warning("VK profiles refresh failed: %s", exc)
+
+    def refresh(self, vk, user_ids):
+        """Fetches the given profiles with a single 'users.get' call"""
+        for profile in vk.users.get(user_ids=",".join(user_ids)):
+            self._profiles.set(str(profile["id"]), profile)
+
+
+profiles = ProfileCache(
+    timeout=settings.CACHING_TIMEOUTS["VK_PROFILE"]["TIMEOUT"],
+    maxsize=settings.CACHING_TIMEOUTS["VK_PROFILE"]["MAXSIZE"],
+)
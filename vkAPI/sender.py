@@ -0,0 +1,98 @@
+import json
+from concurrent.futures import Future
+
+import requests
+import vk_api
+from django.conf import settings
+from vk_api.exceptions import ApiError
+
+from tgBot.outbound import ThrottledSender
+
+# Maximum amount of API calls made by one 'execute'
+EXECUTE_BATCH_SIZE = 25
+# Too many requests per second and flood control, other errors are not retried
+RETRY_ERROR_CODES = {6, 9}
+
+
+class VkSender(ThrottledSender):
+    """Sends 'messages.send' calls, up to 25 of them at once with 'execute'.
+
+    Calls failed with "too many requests" or "flood control" errors and
+    network errors are retried after a growing delay.
+
+    :param call: Makes the API call right away, 'call(method, values, raw=False)'
+    """
+
+    def __init__(self, call, **kwargs):
+        super(VkSender, self).__init__(
+            "vk-sender", batch_size=EXECUTE_BATCH_SIZE, **kwargs
+        )
+        self.call = call
+
+    def send(self, values) -> Future:
+        """Queues 'messages.send' call, the future gets the message id"""
+        return self.submit(values.get("peer_id"), values)
+
+    def _send(self, batch):
+        code = "return [{}];".format(
+            ",".join(
+                "API.messages.send({})".format(
+                    json.dumps(message.payload, ensure_ascii=False)
+                )
+                for message in batch
+            )
+        )
+
+        try:
+            response = self.call("execute", {"code": code}, raw=True)
+        except (ApiError, requests.RequestException) as exc:
+            if isinstance(exc, ApiError) and exc.code not in RETRY_ERROR_CODES:
+                raise
+
+            for message in reversed(batch):
+                self._retry(message, exc)
+            return
+
+        # Every failed call gives 'false' and an item of 'execute_errors'
+        errors = iter(response.get("execute_errors", ()))
+        for message, result in zip(batch, response["response"]):
+            if result is False:
+                error = next(errors, {"error_code": None, "error_msg": "Unknown error"})
+                exc = ApiError(None, "messages.send", message.payload, False, error)
+                if exc.code in RETRY_ERROR_CODES:
+                    self._retry(message, exc)
+                else:
+                    self._fail(message, exc)
+            else:
+                self._succeed(message, result)
+
+
+class QueuedVkApi(vk_api.VkApi):
+    """VkApi which delegates 'messages.send' to 'VkSender', like 'MQBot' does for Telegram.
+
+    'messages.send' returns a 'Future' instead of the message id.
+
+    :param rate: Messages per second, 'VK_SENDER["RATE"]' if 'None'
+    """
+
+    RPS_DELAY = 1 / settings.VK_SENDER["API_RATE"]
+
+    def __init__(self, *args, rate=None, **kwargs):
+        super(QueuedVkApi, self).__init__(*args, **kwargs)
+        self.sender = VkSender(
+            self.call,
+            rate=rate or settings.VK_SENDER["RATE"],
+            peer_rate=settings.VK_SENDER["PEER_RATE"],
+            peer_burst=settings.VK_SENDER["PEER_BURST"],
+            queue_size=settings.VK_SENDER["QUEUE_SIZE"],
+        )
+
+    def method(self, method, values=None, **kwargs):
+        if method == "messages.send":
+            return self.sender.send(values or {})
+
+        return self.call(method, values, **kwargs)
+
+    def call(self, method, values=None, **kwargs):
+        """Makes the API call right away"""
+        return super(QueuedVkApi, self).method(method, values, **kwargs)
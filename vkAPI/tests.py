@@ -0,0 +1,260 @@
+import re
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from vk_api.exceptions import ApiError
+
+from questApp.models import Step
+from vkAPI import main
+from vkAPI.attachments import AttachmentUploader
+from vkAPI.profiles import ProfileCache
+from vkAPI.sender import VkSender
+
+IMAGE = "https://example.com/step.png"
+
+
+class FakeUpload:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.uploads = 0
+
+    def photo_messages(self, photos):
+        threading.Event().wait(self.delay)
+        self.uploads += 1
+        return [{"owner_id": -1, "id": self.uploads}]
+
+
+class AttachmentUploaderTests(TransactionTestCase):
+    def setUp(self):
+        self.step = Step.objects.create(description="Step", image=IMAGE)
+        self.uploader = AttachmentUploader(timeout=None, maxsize=10, wait_timeout=1)
+        patcher = mock.patch.object(self.uploader.session, "get")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, upload, vk_image=None):
+        return self.uploader.get(upload, Step, self.step.pk, "image", IMAGE, vk_image)
+
+    def test_first_send_waits_for_the_upload(self):
+        upload = FakeUpload(delay=0.1)
+
+        self.assertEqual(self.get(upload), "photo-1_1")
+        self.assertEqual(Step.objects.get(pk=self.step.pk).vk_image, "photo-1_1")
+
+    def test_prefetched_image_is_not_uploaded_again(self):
+        upload = FakeUpload()
+        self.uploader.schedule(upload, Step, self.step.pk, "image", IMAGE)
+
+        self.assertEqual(self.get(upload), "photo-1_1")
+        self.assertEqual(self.get(upload), "photo-1_1")
+        self.assertEqual(upload.uploads, 1)
+
+    def test_slow_upload_is_not_waited_for(self):
+        upload = FakeUpload(delay=2)
+
+        self.assertIsNone(self.get(upload))
+
+    def test_saved_attachment_is_returned_right_away(self):
+        upload = FakeUpload()
+
+        self.assertEqual(self.get(upload, vk_image="photo-1_9"), "photo-1_9")
+        self.assertEqual(upload.uploads, 0)
+
+
+class FakeUsers:
+    """'users.get' that names the users after the number of the call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, user_ids):
+        self.calls.append(user_ids)
+        return [
+            {"id": int(user_id), "first_name": "Call %s" % len(self.calls)}
+            for user_id in user_ids.split(",")
+        ]
+
+
+class ProfileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.vk = SimpleNamespace(users=FakeUsers())
+
+    def wait_calls(self, count):
+        for _ in range(100):
+            if len(self.vk.users.calls) >= count:
+                return
+            time.sleep(0.02)
+
+    def test_unknown_user_is_fetched_once(self):
+        profiles = ProfileCache(timeout=60, maxsize=10)
+
+        self.assertEqual(profiles.get(self.vk, 1)["first_name"], "Call 1")
+        self.assertEqual(profiles.get(self.vk, "1")["first_name"], "Call 1")
+        self.assertEqual(self.vk.users.calls, ["1"])
+
+    def test_stale_profiles_are_refreshed_in_one_batch(self):
+        profiles = ProfileCache(timeout=0, maxsize=10, refresh_delay=0.1)
+        profiles.get(self.vk, 1)
+        profiles.get(self.vk, 2)
+
+        # Stale ones are returned right away
+        self.assertEqual(profiles.get(self.vk, 1)["first_name"], "Call 1")
+        self.assertEqual(profiles.get(self.vk, 2)["first_name"], "Call 2")
+
+        self.wait_calls(3)
+        self.assertEqual(sorted(self.vk.users.calls[2].split(",")), ["1", "2"])
+        self.assertEqual(profiles.get(self.vk, 1)["first_name"], "Call 3")
+
+    def test_failed_refresh_is_tried_on_next_access(self):
+        profiles = ProfileCache(timeout=0, maxsize=10, refresh_delay=0)
+        profiles.get(self.vk, 1)
+
+        with mock.patch.object(
+            self.vk.users, "get", side_effect=RuntimeError
+        ) as failing_get:
+            with self.assertLogs("vkAPI.profiles", "WARNING"):
+                profiles.get(self.vk, 1)
+                for _ in range(100):
+                    if failing_get.called:
+                        break
+                    time.sleep(0.02)
+                # The failure is logged right after the call
+                time.sleep(0.1)
+
+        self.assertEqual(profiles.get(self.vk, 1)["first_name"], "Call 1")
+        self.wait_calls(2)
+        self.assertEqual(self.vk.users.calls, ["1", "1"])
+
+
+class Stop(Exception):
+    pass
+
+
+@override_settings(VK_RECONNECT={"BACKOFF": 1, "MAX_BACKOFF": 4})
+class ReconnectTests(SimpleTestCase):
+    def test_backoff_is_doubled_up_to_the_maximum(self):
+        self.assertEqual(
+            [main.get_backoff(failures) for failures in range(1, 6)], [1, 2, 4, 4, 4]
+        )
+
+    def test_long_poll_is_reconnected_after_failures(self):
+        long_poll = mock.Mock()
+        long_poll.check.side_effect = [
+            ConnectionError("reset"),
+            ConnectionError("reset"),
+            ["event"],
+            ConnectionError("reset"),
+        ]
+        connect = mock.Mock(return_value=long_poll)
+        # Ends the endless loop on the third wait
+        sleep = mock.Mock(side_effect=[None, None, Stop])
+
+        with mock.patch.multiple(
+            main,
+            QueuedVkApi=mock.DEFAULT,
+            VkUpload=mock.DEFAULT,
+            DeliveryScheduler=mock.DEFAULT,
+            create_executor=mock.DEFAULT,
+            attachments=mock.DEFAULT,
+            metrics=mock.DEFAULT,
+            dispatch=mock.DEFAULT,
+            VkBotLongPoll=connect,
+        ) as patched, mock.patch.object(main.time, "sleep", sleep):
+            with self.assertLogs("vkAPI.main", "WARNING"), self.assertRaises(Stop):
+                main.main()
+
+        # Failures in a row are reset by the events that came in between
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2, 1])
+        # The server is asked again without a new long poll
+        self.assertEqual(connect.call_count, 1)
+        long_poll.update_longpoll_server.assert_called_with(update_ts=False)
+        self.assertEqual(long_poll.update_longpoll_server.call_count, 2)
+        self.assertEqual(patched["dispatch"].call_args.args[0], "event")
+
+
+class FakeExecute:
+    """'execute' call that answers every 'messages.send' with its peer id"""
+
+    def __init__(self, errors=None):
+        # peer_id -> error codes of the next attempts
+        self.errors = errors or {}
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, method, values, raw=False):
+        self.release.wait(5)
+        peer_ids = [int(peer_id) for peer_id in re.findall(r'"peer_id": (\d+)', values["code"])]
+        self.batches.append(peer_ids)
+
+        response, execute_errors = [], []
+        for peer_id in peer_ids:
+            codes = self.errors.get(peer_id)
+            if codes:
+                response.append(False)
+                execute_errors.append({"error_code": codes.pop(0), "error_msg": "Error"})
+            else:
+                response.append(peer_id)
+
+        return {"response": response, "execute_errors": execute_errors}
+
+
+class VkSenderTests(SimpleTestCase):
+    def create(self, call):
+        return VkSender(
+            call,
+            rate=1000,
+            peer_rate=1000,
+            peer_burst=100,
+            queue_size=100,
+            retry_delay=0.01,
+        )
+
+    def test_waiting_messages_are_sent_with_one_execute(self):
+        call = FakeExecute()
+        sender = self.create(call)
+        call.release.clear()
+        first = sender.send({"peer_id": 1, "message": "text"})
+        time.sleep(0.1)
+
+        futures = [sender.send({"peer_id": peer_id}) for peer_id in range(2, 32)]
+        call.release.set()
+
+        self.assertEqual(first.result(5), 1)
+        self.assertEqual([future.result(5) for future in futures], list(range(2, 32)))
+        self.assertEqual(
+            call.batches, [[1], list(range(2, 27)), list(range(27, 32))]
+        )
+
+    def test_flood_control_is_retried_and_other_errors_fail(self):
+        call = FakeExecute(errors={1: [9], 2: [901]})
+        sender = self.create(call)
+
+        with self.assertLogs("tgBot.outbound", "WARNING"):
+            retried = sender.send({"peer_id": 1})
+            failed = sender.send({"peer_id": 2})
+
+            self.assertEqual(retried.result(5), 1)
+            with self.assertRaises(ApiError) as raised:
+                failed.result(5)
+
+        self.assertEqual(raised.exception.code, 901)
+
+    def test_network_error_retries_the_batch(self):
+        call = FakeExecute()
+        failures = [requests.ConnectionError("reset")]
+
+        def flaky_call(method, values, raw=False):
+            if failures:
+                raise failures.pop()
+
+            return call(method, values, raw)
+
+        sender = self.create(flaky_call)
+
+        self.assertEqual(sender.send({"peer_id": 1}).result(5), 1)
+        self.assertEqual(call.batches, [[1]])
@@ -1,43 +1,52 @@
-import os
-import sys
-
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tgBot.settings")
-sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
-
-import requests
-import django
-
-django.setup()
-
 from django.conf import settings
 
 from vk_api.keyboard import VkKeyboard
 from vk_api.utils import get_random_id
 
 from questApp import quest_utils
+from questApp.models import Step
+from tgBot import keyboards
+from vkAPI.attachments import attachments
+from vkAPI.profiles import profiles
 
-session = requests.Session()
 
+def render_keyboard(texts):
+    """Returns serialized keyboard with a button per row for every text"""
+    button_list = VkKeyboard()
+    for i, text in enumerate(texts):
+        if i:
+            button_list.add_line()
+        button_list.add_button(text)
 
-def get_or_upload_photo(upload, obj, attr, image):
-    obj = obj.__class__.objects.only("vk_" + attr).get(pk=obj.pk)
-    vk_image = getattr(obj, "vk_" + attr)
-    if vk_image:
-        return vk_image
-    else:
-        photo_raw = session.get(image, stream=True).raw
-        photo = upload.photo_messages(photos=photo_raw)[0]
-        photo = "photo{}_{}".format(photo["owner_id"], photo["id"])
+    return button_list.get_keyboard()
+
+
+def get_menu_keyboard(menu_id):
+    return keyboards.get_or_render(
+        "VK", (menu_id,), lambda: render_keyboard(keyboards.menu_texts(menu_id))
+    )
+
+
+def get_list_keyboard(texts):
+    texts = tuple(texts)
+    return keyboards.get_or_render(
+        "VK", ("LIST",) + texts, lambda: render_keyboard(keyboards.list_texts(texts))
+    )
+
+
+def get_step_keyboard(step, player_quest):
+    """Returns keyboard of visible options of the 'step', empty one if there are none"""
 
-        setattr(obj, "vk_" + attr, photo)
-        obj.save()
+    def render():
+        texts = keyboards.step_texts(step, player_quest)
+        return render_keyboard(texts) if texts else ""
 
-        return photo
+    return keyboards.get_or_render("VK", keyboards.step_key(step, player_quest), render)
 
 
 def get_or_create_player(vk, event, args=None, join=False):
     user_id = str(event.obj.user_id) if join else str(event.obj.from_id)
-    vk_info = vk.users.get(user_ids=user_id)[0]
+    vk_info = profiles.get(vk, user_id)
     player_type = "VK"
     user_login = "VK:" + str(vk_info["id"])
 
@@ -51,114 +60,53 @@ def get_or_create_player(vk, event, args=None, join=False):
     )
 
 
-def _send_step_final(vk, job):
+def send_message(vk, peer_id, text, keyboard):
     vk.messages.send(
-        peer_id=job.context[0],
-        random_id=get_random_id(),
-        message=job.context[1],
-        keyboard=job.context[2],
+        peer_id=peer_id, random_id=get_random_id(), message=text, keyboard=keyboard
     )
 
 
-def _send_step_part(vk, job):
-    vk.messages.send(
-        peer_id=job.context[0],
-        random_id=get_random_id(),
-        message=job.context[1],
-        keyboard=job.context[2],
-    )
+def send_step_partly(vk, peer_id, scheduler, keyboard, parts):
+    """Sends the first part of the Step and schedules the rest, step keyboard comes last"""
+    button_list = get_menu_keyboard("STEP_PART")
+    messages = [(part.delay, part.text, button_list) for part in parts[1:]]
 
+    if messages:
+        delay, text, _ = messages[-1]
+        messages[-1] = (delay, text, keyboard)
+        send_message(vk, peer_id, parts[0].text, button_list)
+    else:
+        send_message(vk, peer_id, parts[0].text, keyboard)
 
-def send_step_partly(vk, event, job_queue, keyboard, delay_temp, description):
-    step_parts = description.split("_")
-    step_parts_len = len(step_parts)
-    start = 0
-    button_list = VkKeyboard()
-    button_list.add_button(quest_utils.menu_text_full("MAIN_MENU"))
-    button_list = button_list.get_keyboard()
-    keyboard_temp = keyboard.get_keyboard()
-
-    for i, part_temp in enumerate(step_parts):
-        part = part_temp.split("~")
-        delay = float(part[1]) if len(part) >= 2 else delay_temp
-        if i == 0 and i == step_parts_len - 1:
-            job_queue.run_once(
-                _send_step_final,
-                start,
-                context=(event.obj.from_id, part[0], keyboard_temp),
-            )
-        elif i == 0:
-            job_queue.run_once(
-                _send_step_part,
-                start,
-                context=(event.obj.from_id, part[0], button_list),
-            )
-        elif i == step_parts_len - 1:
-            start += delay
-            job_queue.run_once(
-                _send_step_final,
-                start,
-                context=(event.obj.from_id, part[0], keyboard_temp),
-            )
-        else:
-            start += delay
-            job_queue.run_once(
-                _send_step_part,
-                start,
-                context=(event.obj.from_id, part[0], button_list),
-            )
+    scheduler.schedule(peer_id, messages)
 
 
-def build_step(vk, event, upload, job_queue, step, player_quest, text="Вы победили!"):
+def build_step(vk, event, upload, scheduler, step, player_quest, text="Вы победили!"):
     if step:
-        print(step)
-        if step.image:
-            image = get_or_upload_photo(upload, step, "image", step.image)
+        image = step.image and attachments.get(
+            upload, Step, step.id, "image", step.image, step.vk_image
+        )
+        if image:
             vk.messages.send(
                 peer_id=event.obj.from_id, random_id=get_random_id(), attachment=image
             )
 
-        options_temp = step.options.all()
-        options = []
-        changes = player_quest.changes.all()
-        for option in options_temp:
-            is_hidden = option.is_hidden
-            if option in changes:
-                is_hidden = not option.is_hidden
-            if not is_hidden:
-                options.append(option)
-
-        if options:
-            button_list = VkKeyboard()
-            for option in options:
-                button_list.add_button(option.text)
-                button_list.add_line()
-            button_list.add_button(quest_utils.menu_text_full("MAIN_MENU"))
-            send_step_partly(
-                vk, event, job_queue, button_list, step.delay, step.description
-            )
-        else:
-            # Step has no options - Lose
-            button_list = VkKeyboard()
-            button_list.add_button(quest_utils.menu_text_full("ASK_TO_RESTART"))
-            button_list.add_line()
-            button_list.add_button(quest_utils.menu_text_full("MAIN_MENU"))
-            vk.messages.send(
-                peer_id=event.obj.from_id,
-                random_id=get_random_id(),
-                message=step.description,
-                keyboard=button_list.get_keyboard(),
-            )
+        # Step has no options - Lose
+        keyboard = get_step_keyboard(step, player_quest) or get_menu_keyboard("GAME_OVER")
+
+        send_step_partly(
+            vk,
+            event.obj.from_id,
+            scheduler,
+            keyboard,
+            step.parts,
+        )
     else:
-        button_list = VkKeyboard()
-        button_list.add_button(quest_utils.menu_text_full("ASK_TO_RESTART"))
-        button_list.add_line()
-        button_list.add_button(quest_utils.menu_text_full("MAIN_MENU"))
         vk.messages.send(
             peer_id=event.obj.from_id,
             random_id=get_random_id(),
             message=(text + "\nНачать заново?"),
-            keyboard=button_list.get_keyboard(),
+            keyboard=get_menu_keyboard("GAME_OVER"),
         )
 
 
@@ -168,16 +116,14 @@ def send_referral_input(vk, event):
     if created:
         player.is_next_message_referral = True
         player.save()
-        button_list = VkKeyboard()
-        button_list.add_button(quest_utils.menu_text_full("START_WO_REFERRED"))
         text = (
             'Укажите ID пользователя, который вас пригласил или нажмите "'
-            + quest_utils.menu_text_full("START_WO_REFERRED")
+            + quest_utils.menu_text_full("START_WO_REFERRER")
             + '", чтобы пропустить этот этап'
         )
         vk.messages.send(
             peer_id=event.obj.user_id,
             random_id=get_random_id(),
             message=text,
-            keyboard=button_list.get_keyboard(),
+            keyboard=get_menu_keyboard("REFERRAL"),
         )